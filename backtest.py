@@ -0,0 +1,221 @@
+"""Vectorized backtests of the trade.py stop losses over a price matrix.
+
+prices is a (ticks, symbols) float64 matrix, one row per markPrice frame,
+and an entry is a (row, column) pair: the trade opens at prices[row, column]
+and, as in mover_trading.py, is first checked on the next row. Every stop
+parameter of a sweep is evaluated for every entry together in numpy, with
+the same comparisons and arithmetic as TrailingStopLossTrade,
+ConstantStopLossTrade and Trade.calculate_profit_loss, so the exits and
+results are identical to running the classes tick by tick.
+
+NaN prices are ticks where the symbol had no price. They are checked as the
+last known price, as mover_trading.py does. That price was checked already,
+so only a constant stop the entry price already crosses exits on one.
+"""
+import numpy as np
+import pandas as pd
+from decoders import decode_mark_prices
+from replay import iter_frames
+from trade import profit_loss
+
+CHUNK_ELEMENTS = 1 << 24  # Upper bound of (parameters x entries x ticks) evaluated at once
+FIRST_BLOCK = 32  # Ticks checked in the first block, doubled for every following one
+RESULT_COLUMNS = ['Entry Reason', 'Symbol', 'Entry Time', 'Entry Price', 'Exit Time', 'Exit Price', 'Trailing Stop Loss', 'Profit/Loss', 'Stop Type']
+
+
+def load_price_matrix(directory, quote="USDT"):
+    """(times, symbols, prices) of a markPrice recording, prices forward-filled per symbol."""
+    times = []
+    ticks = []
+    index = {}
+    for received_ns, message in iter_frames(directory, ["markPrice"]):
+        frame = decode_mark_prices(message, quote)
+        if frame is None:
+            continue
+
+        columns = [index.setdefault(symbol, len(index)) for symbol in frame.symbols]
+        times.append(received_ns / 1e9)
+        ticks.append((columns, frame.prices))
+
+    prices = np.full((len(ticks), len(index)), np.nan)
+    for row, (columns, values) in enumerate(ticks):
+        prices[row, columns] = values
+
+    prices = pd.DataFrame(prices).ffill().to_numpy()
+    return np.array(times), list(index), prices
+
+
+def _paths(prices, entry_rows, columns, horizon):
+    # Prices each entry is checked against, NaN past the end of the matrix
+    offsets = entry_rows[:, None] + 1 + np.arange(horizon)
+    paths = prices[np.minimum(offsets, len(prices) - 1), columns[:, None]]
+    paths[offsets >= len(prices)] = np.nan
+    return paths, offsets
+
+
+def _first_exits(hits, offsets):
+    # hits is (parameters, entries, ticks), returns the first hit row per parameter and entry, -1 if none
+    first = hits.argmax(axis=2)
+    rows = offsets[np.arange(offsets.shape[0]), first]
+    return np.where(hits.any(axis=2), rows, -1)
+
+
+def _scan(prices, entry_rows, columns, exits, horizon, block_hits):
+    """Fill exits (parameters, entries) block by block of ticks after the entries.
+
+    Most trades close within a few ticks, so blocks start small and double,
+    and entries whose every parameter has exited are dropped from later
+    blocks. block_hits(entries, paths) returns the (parameters, entries,
+    ticks) exit conditions of one block.
+    """
+    if horizon is None:
+        horizon = len(prices) - 1 - int(entry_rows.min()) if len(entry_rows) else 0
+
+    start = 0
+    block = FIRST_BLOCK
+    while start < horizon:
+        entries = np.flatnonzero((exits == -1).any(axis=0))
+        if not len(entries):
+            break
+
+        block = min(block, horizon - start)
+        chunk = max(1, CHUNK_ELEMENTS // (len(exits) * block))
+        for first in range(0, len(entries), chunk):
+            selected = entries[first:first + chunk]
+            paths, offsets = _paths(prices, entry_rows[selected] + start, columns[selected], block)
+            found = _first_exits(block_hits(selected, paths), offsets)
+
+            current = exits[:, selected]
+            exits[:, selected] = np.where(current == -1, found, current)
+
+        start += block
+        block *= 2
+
+    return exits
+
+
+def trailing_stop_exits(prices, entry_rows, columns, side_long, percentages, horizon=None):
+    """Exit rows (parameters, entries) of TrailingStopLossTrade for each trailing percentage, -1 while open.
+
+    horizon limits how many ticks after the entry are checked, all of them by default.
+    """
+    entry_rows = np.asarray(entry_rows)
+    columns = np.asarray(columns)
+    side_long = np.asarray(side_long, dtype=bool)
+    fractions = np.asarray(percentages, dtype=np.float64)[:, None, None] / 100
+
+    # Extremes so far per entry, carried from block to block
+    highest = prices[entry_rows, columns].copy()
+    lowest = highest.copy()
+
+    def block_hits(entries, paths):
+        # Extreme before each tick: the classes compare against it and only then move it
+        high = np.fmax.accumulate(np.concatenate([highest[entries, None], paths[:, :-1]], axis=1), axis=1)
+        low = np.fmin.accumulate(np.concatenate([lowest[entries, None], paths[:, :-1]], axis=1), axis=1)
+        highest[entries] = np.fmax(high[:, -1], paths[:, -1])
+        lowest[entries] = np.fmin(low[:, -1], paths[:, -1])
+
+        long_hits = (paths <= high) & (paths < high - high * fractions)
+        short_hits = (paths >= low) & (paths > low + low * fractions)
+        return np.where(side_long[entries, None], long_hits, short_hits)
+
+    exits = np.full((len(fractions), len(entry_rows)), -1)
+    return _scan(prices, entry_rows, columns, exits, horizon, block_hits)
+
+
+def constant_stop_prices(prices, entry_rows, columns, side_long, added_percentages, lookback):
+    """Stop prices (parameters, entries) as mover_trading.get_stop_loss sets them at entry.
+
+    The stop is the lowest (long) or highest (short) price of the lookback
+    rows up to and including the entry, moved away by each added percentage.
+    """
+    entry_rows = np.asarray(entry_rows)
+    columns = np.asarray(columns)
+    side_long = np.asarray(side_long, dtype=bool)
+    added = np.asarray(added_percentages, dtype=np.float64)[:, None]
+
+    offsets = entry_rows[:, None] - np.arange(lookback)[::-1]
+    windows = prices[np.maximum(offsets, 0), columns[:, None]]
+    windows[offsets < 0] = np.nan
+
+    lowest = np.nanmin(windows, axis=1)
+    highest = np.nanmax(windows, axis=1)
+    return np.where(side_long, lowest - lowest * added / 100, highest + highest * added / 100)
+
+
+def constant_stop_exits(prices, entry_rows, columns, side_long, stop_prices, horizon=None):
+    """Exit rows (parameters, entries) of ConstantStopLossTrade for each row of stop_prices, -1 while open."""
+    entry_rows = np.asarray(entry_rows)
+    columns = np.asarray(columns)
+    side_long = np.asarray(side_long, dtype=bool)
+    stop_prices = np.atleast_2d(stop_prices)
+
+    def block_hits(entries, paths):
+        stops = stop_prices[:, entries, None]
+        return np.where(side_long[entries, None], paths <= stops, paths >= stops)
+
+    exits = np.full(stop_prices.shape, -1)
+    exits = _scan(prices, entry_rows, columns, exits, horizon, block_hits)
+
+    # An entry price past its stop is what the next tick re-checks when that tick has no price
+    entry_prices = prices[entry_rows, columns]
+    next_rows = entry_rows + 1
+    unpriced = next_rows < len(prices)
+    unpriced[unpriced] = np.isnan(prices[next_rows[unpriced], columns[unpriced]])
+    entry_hits = np.where(side_long, entry_prices <= stop_prices, entry_prices >= stop_prices)
+    return np.where(entry_hits & unpriced, next_rows, exits)
+
+
+def _results(times, symbols, prices, entry_rows, columns, side_long, position_amounts, reasons, exits, parameters, stop_type):
+    n_parameters, n_entries = exits.shape
+    exited = exits >= 0
+    entry_prices = prices[entry_rows, columns]
+
+    exit_prices = np.where(exited, prices[np.maximum(exits, 0), columns], np.nan)
+    exit_times = np.where(exited, times[np.maximum(exits, 0)], np.nan)
+    results = profit_loss(entry_prices, exit_prices, position_amounts, side_long)
+
+    return pd.DataFrame({
+        'Entry Reason': np.tile(reasons, n_parameters),
+        'Symbol': np.tile(np.asarray(symbols, dtype=object)[columns], n_parameters),
+        'Entry Time': np.tile(times[entry_rows], n_parameters),
+        'Entry Price': np.tile(entry_prices, n_parameters),
+        'Exit Time': exit_times.ravel(),
+        'Exit Price': exit_prices.ravel(),
+        'Trailing Stop Loss': np.repeat(parameters, n_entries),
+        'Profit/Loss': results.ravel(),
+        'Stop Type': stop_type,
+    }, columns=RESULT_COLUMNS)
+
+
+def sweep(times, symbols, prices, entry_rows, columns, side_long, trailing_percentages=(), added_percentages=(),
+          position_amounts=100, reasons="", lookback=60, horizon=None):
+    """Backtest every entry with every trailing and constant stop parameter.
+
+    Returns one row per (parameter, entry) with the columns mover_trading.py
+    writes to trade_testing_data.csv plus the stop type. As in the live
+    results, 'Trailing Stop Loss' holds the added percentage for constant stops.
+    Trades still open at the end have NaN exit and Profit/Loss.
+    """
+    entry_rows = np.asarray(entry_rows)
+    columns = np.asarray(columns)
+    side_long = np.asarray(side_long, dtype=bool)
+    position_amounts = np.broadcast_to(np.asarray(position_amounts, dtype=np.float64), entry_rows.shape)
+    reasons = np.broadcast_to(np.asarray(reasons, dtype=object), entry_rows.shape)
+    times = np.asarray(times)
+
+    frames = []
+    if len(trailing_percentages):
+        exits = trailing_stop_exits(prices, entry_rows, columns, side_long, trailing_percentages, horizon)
+        frames.append(_results(times, symbols, prices, entry_rows, columns, side_long, position_amounts, reasons,
+                               exits, trailing_percentages, "trailing"))
+
+    if len(added_percentages):
+        stops = constant_stop_prices(prices, entry_rows, columns, side_long, added_percentages, lookback)
+        exits = constant_stop_exits(prices, entry_rows, columns, side_long, stops, horizon)
+        frames.append(_results(times, symbols, prices, entry_rows, columns, side_long, position_amounts, reasons,
+                               exits, added_percentages, "constant"))
+
+    if not frames:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
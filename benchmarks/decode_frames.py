@@ -0,0 +1,93 @@
+"""Frames/sec of the websocket frame decoding, legacy dict path vs decoders.py.
+
+Run from the repository root: python benchmarks/decode_frames.py
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import decoders
+
+N_SYMBOLS = 400
+N_FRAMES = 2000
+
+
+def make_mark_price_frame(n_symbols):
+    now = int(time.time() * 1000)
+    data = []
+    for i in range(n_symbols):
+        quote = "USDT" if i % 10 else "USDC"
+        data.append({"e": "markPriceUpdate", "E": now, "s": f"SYM{i}{quote}", "p": f"{random.uniform(0.001, 1000):.8f}",
+                     "i": f"{random.uniform(0.001, 1000):.8f}", "P": "0.0", "r": "0.00010000", "T": now})
+    return json.dumps({"stream": "!markPrice@arr", "data": data})
+
+
+def make_force_order_frame():
+    now = int(time.time() * 1000)
+    order = {"s": random.choice(["BTCUSDT", "WIFUSDT", "ORDIUSDT"]), "S": random.choice(["BUY", "SELL"]), "o": "LIMIT", "f": "IOC",
+             "q": f"{random.uniform(1, 1000):.3f}", "p": f"{random.uniform(1, 100):.4f}", "ap": f"{random.uniform(1, 100):.4f}",
+             "X": "FILLED", "l": "1", "z": "1", "T": now}
+    return json.dumps({"stream": "!forceOrder@arr", "data": {"e": "forceOrder", "E": now, "o": order}})
+
+
+def legacy_mark_prices(message):
+    # Decode path of top_movers.ws_connect before decoders.py
+    data = json.loads(message)
+    symbols = []
+    prices = []
+    if "stream" in data and "!markPrice@arr" in data["stream"]:
+        for symbol_data in data["data"]:
+            symbol = symbol_data["s"]
+            price = float(symbol_data["p"])
+            if symbol[-4:] == "USDT":
+                symbols.append(symbol)
+                prices.append(price)
+    return symbols, prices
+
+
+def legacy_force_order(message):
+    # Decode path of liquidation_tracker.ws_connect before decoders.py
+    data = json.loads(message)
+    if "stream" in data and "@arr" in data["stream"]:
+        data = data["data"]["o"]
+        open_price = float(data["ap"])
+        liq_price = float(data["p"])
+        liq_amount = float(data["p"]) * float(data["q"])
+        ts = data["T"]
+        dt = datetime.fromtimestamp(ts // 1000) + timedelta(milliseconds=ts % 1000)
+        return data["s"], data["S"], open_price, liq_price, liq_amount, dt
+
+
+def frames_per_second(decode, frames):
+    start = time.perf_counter()
+    for frame in frames:
+        decode(frame)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    mark_frames = [make_mark_price_frame(N_SYMBOLS) for _ in range(50)] * (N_FRAMES // 50)
+    order_frames = [make_force_order_frame() for _ in range(N_FRAMES)] * 10
+
+    results = [("markPrice@arr legacy", frames_per_second(legacy_mark_prices, mark_frames))]
+    for backend in decoders.available_backends():
+        decoders.set_backend(backend)
+        results.append((f"markPrice@arr decoders ({backend})", frames_per_second(decoders.decode_mark_prices, mark_frames)))
+
+    results.append(("forceOrder legacy", frames_per_second(legacy_force_order, order_frames)))
+    for backend in decoders.available_backends():
+        decoders.set_backend(backend)
+        results.append((f"forceOrder decoders ({backend})", frames_per_second(decoders.decode_force_order, order_frames)))
+
+    print(f"{N_SYMBOLS} symbols per markPrice frame")
+    for name, fps in results:
+        print(f"{name:<36} {fps:>12,.0f} frames/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""Per-call latency percentiles of the per-tick hot paths, with JSON output to compare runs.
+
+Run from the repository root:
+
+    python benchmarks/hot_paths.py --json bench.json
+    python benchmarks/hot_paths.py --symbols 1000 --window 240 --compare bench.json
+
+Inputs are synthetic but shaped like the live streams: mark prices follow a
+random walk per symbol, forceOrder frames arrive in bursts and klines have
+the REST candlestick layout. Every case reports p50/p90/p99/max in
+microseconds; --compare flags cases whose p50 got slower than the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import decoders
+from benchmarks.decode_frames import make_force_order_frame
+from liquidation_windows import LiquidationAggregator, LONG, SHORT
+from price_store import PriceStore
+from ranking import get_recent_bar_count, rank_movers
+from trade import TrailingStopLossTrade
+from trade_book import TradeBook
+from trendline_index import TrendlineIndex
+from wick_tracker import calculate_retracement
+
+SYMBOL_COUNTS = [300, 1000]
+WINDOW_SIZES = [60]
+CALLS = 500
+OPEN_TRADES = 500
+BURST_SIZE = 50
+TRENDLINES_PER_SYMBOL = 4
+REGRESSION_THRESHOLD = 0.2  # p50 slower than this share counts as a regression
+
+
+def mark_price_walk(n_symbols, n_ticks, seed=0):
+    """Symbols and a (ticks, symbols) random walk of mark prices, 0.2% steps a second."""
+    rng = np.random.default_rng(seed)
+    symbols = [f"SYM{i}USDT" for i in range(n_symbols)]
+    start = rng.uniform(0.001, 1000, n_symbols)
+    steps = 1 + rng.normal(0, 0.002, (n_ticks, n_symbols))
+    return symbols, start * np.cumprod(steps, axis=0)
+
+
+def make_mark_price_frames(symbols, prices, event_time=0):
+    frames = []
+    for tick, row in enumerate(prices):
+        data = [{"e": "markPriceUpdate", "E": event_time + tick * 1000, "s": symbol, "p": f"{price:.8f}",
+                 "i": f"{price:.8f}", "P": "0.0", "r": "0.00010000", "T": event_time}
+                for symbol, price in zip(symbols, row)]
+        frames.append(json.dumps({"stream": "!markPrice@arr", "data": data}))
+    return frames
+
+
+def make_klines(n, seed=0):
+    # REST candlestick rows: [open time, open, high, low, close, volume, ...] as strings
+    rng = random.Random(seed)
+    klines = []
+    for i in range(n):
+        open_p = rng.uniform(1, 100)
+        close_p = open_p * rng.uniform(0.97, 1.03)
+        high_p = max(open_p, close_p) * rng.uniform(1, 1.02)
+        low_p = min(open_p, close_p) * rng.uniform(0.98, 1)
+        klines.append([i * 60000, f"{open_p:.4f}", f"{high_p:.4f}", f"{low_p:.4f}", f"{close_p:.4f}", "1000", i * 60000 + 59999])
+    return klines
+
+
+def measure(call, calls=CALLS):
+    """Per-call latencies in microseconds of call(i) for i in range(calls)."""
+    latencies = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter_ns()
+        call(i)
+        latencies[i] = (time.perf_counter_ns() - start) / 1000
+    return latencies
+
+
+def summarize(name, params, latencies):
+    return {
+        "name": name,
+        "params": params,
+        "calls": len(latencies),
+        "p50_us": float(np.percentile(latencies, 50)),
+        "p90_us": float(np.percentile(latencies, 90)),
+        "p99_us": float(np.percentile(latencies, 99)),
+        "max_us": float(latencies.max()),
+    }
+
+
+def filled_store(symbols, prices, window):
+    store = PriceStore(window)
+    for row in prices[:window]:
+        store.update(symbols, row)
+    return store
+
+
+def bench_mark_prices(n_symbols, window, calls):
+    params = {"symbols": n_symbols, "window": window}
+    symbols, prices = mark_price_walk(n_symbols, window + calls)
+    frames = make_mark_price_frames(symbols, prices[window:window + 50])
+    results = []
+
+    results.append(summarize(f"decode_mark_prices ({decoders.BACKEND})", params,
+                             measure(lambda i: decoders.decode_mark_prices(frames[i % len(frames)]), calls)))
+
+    store = filled_store(symbols, prices, window)
+    results.append(summarize("PriceStore.update", params,
+                             measure(lambda i: store.update(symbols, prices[window + i]), calls)))
+
+    results.append(summarize("rank_movers", params, measure(lambda i: rank_movers(store, 5, 3), calls)))
+    results.append(summarize("get_recent_bar_count", params, measure(lambda i: get_recent_bar_count(store, 3), calls)))
+    return results
+
+
+def bench_trades(n_symbols, window, calls):
+    params = {"symbols": n_symbols, "window": window, "open_trades": OPEN_TRADES}
+    symbols, prices = mark_price_walk(n_symbols, window + calls, seed=1)
+    store = filled_store(symbols, prices, window)
+    rng = np.random.default_rng(2)
+    rows = rng.integers(0, n_symbols, OPEN_TRADES)
+    sides = rng.random(OPEN_TRADES) < 0.5
+    results = []
+
+    # Huge stops so the book stays the same size for every call
+    trades = [TrailingStopLossTrade(symbols[row], prices[window - 1, row], 100, 0, bool(side), "bench", 1000)
+              for row, side in zip(rows, sides)]
+
+    def check_objects(i):
+        store.update(symbols, prices[window + i])
+        for trade in trades:
+            trade.check(store.last(trade.symbol), i)
+
+    results.append(summarize("Trade.check loop + PriceStore.update", params, measure(check_objects, calls)))
+
+    store = filled_store(symbols, prices, window)
+    book = TradeBook()
+    for row, side in zip(rows, sides):
+        book.open_trailing(symbols[row], row, prices[window - 1, row], 100, 0, bool(side), "bench", 1000)
+
+    def check_book(i):
+        store.update(symbols, prices[window + i])
+        book.check(store.lasts(), i)
+
+    results.append(summarize("TradeBook.check + PriceStore.update", params, measure(check_book, calls)))
+    return results
+
+
+def bench_liquidations(calls):
+    params = {"burst": BURST_SIZE}
+    frames = [make_force_order_frame() for _ in range(BURST_SIZE)]
+    aggregator = LiquidationAggregator({"10s": 30000, "1m": 80000, "5m": 200000, "1h": 1000000},
+                                       {"10s": 1000000, "1m": 3000000, "5m": 10000000, "1h": 50000000})
+
+    def burst(i):
+        for frame in frames:
+            order = decoders.decode_force_order(frame)
+            side = SHORT if order.side == "BUY" else LONG
+            aggregator.add(order.symbol, side, order.price * order.quantity, i + order.trade_time / 1000)
+
+    return [summarize("forceOrder burst decode + aggregate", params, measure(burst, calls))]
+
+
+def bench_retracement(calls):
+    klines = make_klines(calls)
+    return [summarize("calculate_retracement", {}, measure(lambda i: calculate_retracement(klines[i]), calls))]
+
+
+def bench_trendlines(n_symbols, calls):
+    params = {"symbols": n_symbols, "trendlines_per_symbol": TRENDLINES_PER_SYMBOL}
+    klines = make_klines(calls)
+    results = []
+
+    rng = np.random.default_rng(3)
+    now = time.time()
+    symbols = [f"SYM{i}USDT" for i in range(n_symbols)]
+    trendlines = {symbol: [[now - 86400 * 30, float(rng.uniform(1, 100)), now - 86400, float(rng.uniform(1, 100)), True]
+                           for _ in range(TRENDLINES_PER_SYMBOL)]
+                  for symbol in symbols}
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trendline_data.json")
+        with open(path, "w") as file:
+            json.dump(trendlines, file)
+
+        index = TrendlineIndex(path, 1.5, 2.5)
+        closes = [float(close) for _, _, _, _, close, _, _ in klines]
+
+        # Like check_candle: one closed kline of one symbol at a time
+        results.append(summarize("check_trendlines", params,
+                                 measure(lambda i: index.check(symbols[i % n_symbols], closes[i], now), calls)))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold=REGRESSION_THRESHOLD):
+    with open(baseline_path, 'r') as file:
+        baseline = {(entry["name"], json.dumps(entry["params"], sort_keys=True)): entry for entry in json.load(file)["results"]}
+
+    regressions = 0
+    print(f"\nCompared with {baseline_path}")
+    for entry in results:
+        old = baseline.get((entry["name"], json.dumps(entry["params"], sort_keys=True)))
+        if old is None:
+            continue
+
+        ratio = entry["p50_us"] / old["p50_us"] if old["p50_us"] else float("inf")
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        regressions += bool(flag)
+        print(f"{entry['name']:<40} {old['p50_us']:>10.1f} -> {entry['p50_us']:>10.1f} us  x{ratio:.2f} {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--symbols", nargs="+", type=int, default=SYMBOL_COUNTS)
+    parser.add_argument("--window", nargs="+", type=int, default=WINDOW_SIZES)
+    parser.add_argument("--calls", type=int, default=CALLS)
+    parser.add_argument("--json", metavar="PATH", help="save the results to PATH")
+    parser.add_argument("--compare", metavar="PATH", help="compare p50 latencies with an earlier --json file")
+    args = parser.parse_args()
+
+    results = []
+    for n_symbols in args.symbols:
+        for window in args.window:
+            results += bench_mark_prices(n_symbols, window, args.calls)
+            results += bench_trades(n_symbols, window, args.calls)
+        results += bench_trendlines(n_symbols, args.calls)
+    results += bench_retracement(args.calls)
+    results += bench_liquidations(args.calls)
+
+    print(f"{'case':<40} {'params':<44} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (us)")
+    for entry in results:
+        params = " ".join(f"{key}={value}" for key, value in entry["params"].items())
+        print(f"{entry['name']:<40} {params:<44} {entry['p50_us']:>9.1f} {entry['p90_us']:>9.1f} {entry['p99_us']:>9.1f} {entry['max_us']:>9.1f}")
+
+    if args.json:
+        report = {
+            "meta": {
+                "time": time.time(),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.platform(),
+                "decoder": decoders.BACKEND,
+            },
+            "results": results,
+        }
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=1)
+        print(f"Saved to {args.json}")
+
+    if args.compare and compare(results, args.compare):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
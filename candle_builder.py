@@ -0,0 +1,112 @@
+from collections import namedtuple
+import numpy as np
+from kline_store import INTERVAL_MS
+
+CANDLE_INTERVALS = ["1m", "5m", "15m", "1h"]
+INITIAL_CAPACITY = 512
+MAX_START_DELAY_MS = 2000  # A candle whose first tick came later than this after its open is partial and not emitted
+MAX_TICK_GAP_MS = 3000  # Nor is one with a longer gap between two ticks (ticks come every second), its high and low are unknown
+
+# Same index layout as a REST kline row, so check_candle and calculate_retracement take it as is
+Candle = namedtuple("Candle", ["open_time", "open", "high", "low", "close"])
+
+
+class CandleBuilder:
+    """OHLC candles of several intervals for many symbols, built from mark-price ticks.
+
+    Every interval has a row per symbol in preallocated open/high/low/close
+    arrays, grown by doubling like PriceStore. update() folds one frame of
+    prices into the running candles of every interval at once and returns
+    the candles the frame closed, i.e. those whose interval the frame's
+    event time has moved past. A candle that started late or missed ticks,
+    after startup, a reconnect or a symbol dropping out of the frames, is
+    partial and dropped instead of emitted.
+    """
+
+    def __init__(self, intervals=CANDLE_INTERVALS, capacity=INITIAL_CAPACITY):
+        self.intervals = list(intervals)
+        self.interval_ms = [INTERVAL_MS[interval] for interval in self.intervals]
+        self.symbols = []
+        self.index = {}
+
+        shape = (len(self.intervals), capacity)
+        self.open_time = np.full(shape, -1, dtype=np.int64)  # -1 while a row has no candle yet
+        self.last_tick = np.zeros(shape, dtype=np.int64)  # Event time of a candle's latest tick
+        self.complete = np.zeros(shape, dtype=bool)  # False once a candle started late or missed ticks
+        self.open = np.zeros(shape)
+        self.high = np.zeros(shape)
+        self.low = np.zeros(shape)
+        self.close = np.zeros(shape)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _grow(self):
+        for name in ("open_time", "last_tick", "complete", "open", "high", "low", "close"):
+            old = getattr(self, name)
+            new = np.full((old.shape[0], old.shape[1] * 2), -1 if name == "open_time" else 0, dtype=old.dtype)
+            new[:, :old.shape[1]] = old
+            setattr(self, name, new)
+
+    def rows_for(self, symbols):
+        rows = np.empty(len(symbols), dtype=np.int64)
+        for i, symbol in enumerate(symbols):
+            row = self.index.get(symbol)
+            if row is None:
+                row = len(self.symbols)
+                if row == self.open.shape[1]:
+                    self._grow()
+                self.symbols.append(symbol)
+                self.index[symbol] = row
+            rows[i] = row
+        return rows
+
+    def current(self, symbol, interval):
+        """The running, not yet closed candle of symbol, or None."""
+        i = self.intervals.index(interval)
+        row = self.index.get(symbol)
+        if row is None or self.open_time[i, row] < 0:
+            return None
+        return Candle(int(self.open_time[i, row]), float(self.open[i, row]), float(self.high[i, row]),
+                      float(self.low[i, row]), float(self.close[i, row]))
+
+    def update(self, symbols, prices, event_time):
+        """Add one tick per symbol at event_time (ms), return the closed candles as (symbol, interval, Candle)."""
+        rows = self.rows_for(symbols)
+        prices = np.asarray(prices, dtype=np.float64)
+        closed = []
+
+        for i, (interval, interval_ms) in enumerate(zip(self.intervals, self.interval_ms)):
+            bucket = event_time - event_time % interval_ms
+            open_time = self.open_time[i, rows]
+
+            # A gap since the previous tick, within the candle or before it closes, leaves it partial
+            self.complete[i, rows] &= event_time - self.last_tick[i, rows] <= MAX_TICK_GAP_MS
+            self.last_tick[i, rows] = event_time
+            rolling = open_time != bucket
+
+            if rolling.any():
+                ending = rows[rolling]
+                complete = ending[(open_time[rolling] >= 0) & self.complete[i, ending]]
+                values = zip(*(getattr(self, name)[i, complete].tolist() for name in Candle._fields))
+                for row, candle in zip(complete.tolist(), values):
+                    closed.append((self.symbols[row], interval, Candle(*candle)))
+
+                # The tick opens the next candle of these rows
+                opening = prices[rolling]
+                self.open_time[i, ending] = bucket
+                self.complete[i, ending] = event_time - bucket <= MAX_START_DELAY_MS
+                self.open[i, ending] = opening
+                self.high[i, ending] = opening
+                self.low[i, ending] = opening
+                self.close[i, ending] = opening
+
+                rows_in, prices_in = rows[~rolling], prices[~rolling]
+            else:
+                rows_in, prices_in = rows, prices
+
+            self.high[i, rows_in] = np.maximum(self.high[i, rows_in], prices_in)
+            self.low[i, rows_in] = np.minimum(self.low[i, rows_in], prices_in)
+            self.close[i, rows_in] = prices_in
+
+        return closed
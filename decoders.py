@@ -0,0 +1,140 @@
+import json
+from collections import namedtuple
+import numpy as np
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ForceOrder = namedtuple("ForceOrder", ["symbol", "side", "price", "average_price", "quantity", "trade_time", "event_time"])
+MarkPriceFrame = namedtuple("MarkPriceFrame", ["symbols", "prices", "event_time"])
+
+
+def _generic_decoders(loads):
+    # Decode into dicts with any json.loads compatible function, then pick the fields out
+    def decode_force_order(message):
+        frame = loads(message)
+        if "@arr" not in frame.get("stream", ""):
+            return None
+
+        event = frame["data"]
+        order = event["o"]
+        return ForceOrder(
+            symbol=order["s"],
+            side=order["S"],
+            price=float(order["p"]),
+            average_price=float(order["ap"]),
+            quantity=float(order["q"]),
+            trade_time=order["T"],
+            event_time=event["E"],
+        )
+
+    def decode_mark_prices(message, quote="USDT"):
+        frame = loads(message)
+        if "!markPrice@arr" not in frame.get("stream", ""):
+            return None
+
+        entries = [entry for entry in frame["data"] if entry["s"].endswith(quote)]
+        symbols = [entry["s"] for entry in entries]
+        prices = np.array([entry["p"] for entry in entries], dtype=np.float64)
+        event_time = frame["data"][0]["E"] if frame["data"] else 0
+        return MarkPriceFrame(symbols, prices, event_time)
+
+    return decode_force_order, decode_mark_prices
+
+
+def _msgspec_decoders():
+    # Typed schemas: only the fields we use are decoded, and string numbers become floats in C
+    class Order(msgspec.Struct):
+        s: str
+        S: str
+        p: float
+        ap: float
+        q: float
+        T: int
+
+    class ForceOrderEvent(msgspec.Struct):
+        E: int
+        o: Order
+
+    class ForceOrderMessage(msgspec.Struct):
+        stream: str = ""
+        data: ForceOrderEvent = None
+
+    class MarkPrice(msgspec.Struct):
+        s: str
+        p: float
+        E: int
+
+    class MarkPriceArrayMessage(msgspec.Struct):
+        stream: str = ""
+        data: list[MarkPrice] = []
+
+    force_order_decoder = msgspec.json.Decoder(ForceOrderMessage, strict=False)
+    mark_price_decoder = msgspec.json.Decoder(MarkPriceArrayMessage, strict=False)
+
+    def decode_force_order(message):
+        frame = force_order_decoder.decode(message)
+        if "@arr" not in frame.stream:
+            return None
+
+        order = frame.data.o
+        return ForceOrder(order.s, order.S, order.p, order.ap, order.q, order.T, frame.data.E)
+
+    def decode_mark_prices(message, quote="USDT"):
+        frame = mark_price_decoder.decode(message)
+        if "!markPrice@arr" not in frame.stream:
+            return None
+
+        entries = [entry for entry in frame.data if entry.s.endswith(quote)]
+        symbols = [entry.s for entry in entries]
+        prices = np.array([entry.p for entry in entries], dtype=np.float64)
+        event_time = frame.data[0].E if frame.data else 0
+        return MarkPriceFrame(symbols, prices, event_time)
+
+    return decode_force_order, decode_mark_prices
+
+
+def available_backends():
+    backends = ["json"]
+    if orjson is not None:
+        backends.append("orjson")
+    if msgspec is not None:
+        backends.append("msgspec")
+    return backends
+
+
+def set_backend(name):
+    """Switch the decoders used by decode_force_order / decode_mark_prices."""
+    global BACKEND, _decode_force_order, _decode_mark_prices
+
+    if name == "msgspec":
+        _decode_force_order, _decode_mark_prices = _msgspec_decoders()
+    elif name == "orjson":
+        _decode_force_order, _decode_mark_prices = _generic_decoders(orjson.loads)
+    elif name == "json":
+        _decode_force_order, _decode_mark_prices = _generic_decoders(json.loads)
+    else:
+        raise ValueError(f"Unknown decoder backend: {name}")
+
+    BACKEND = name
+
+
+def decode_force_order(message):
+    """Decode a !forceOrder@arr combined-stream frame into a ForceOrder, None for anything else."""
+    return _decode_force_order(message)
+
+
+def decode_mark_prices(message, quote="USDT"):
+    """Decode a !markPrice@arr frame into symbol and price columns, None for anything else."""
+    return _decode_mark_prices(message, quote)
+
+
+# Fastest decoder that is installed, stdlib json otherwise
+set_backend(available_backends()[-1])
@@ -0,0 +1,64 @@
+import asyncio
+from collections import deque
+import metrics
+
+MAX_PENDING = 10000  # Lossless items held before the receiver has to wait for the processor
+
+_CONFLATED = object()  # Queue entry standing for the newest item of a conflated key
+
+
+class FrameQueue:
+    """Hands frames from a receiving task to a processing task, per key latest-wins or lossless.
+
+    Items of a key in conflate keep a single slot: a newer item replaces one
+    the processor has not taken yet (counted as merged) and keeps its place
+    in line, so the processor always works on the freshest snapshot. Every
+    other key is first in, first out and never dropped; once maxsize of
+    those are waiting, put() waits for the processor instead.
+    """
+
+    def __init__(self, name, conflate=(), maxsize=MAX_PENDING):
+        self.conflate = set(conflate)
+        self.maxsize = maxsize
+        self.pending = deque()
+        self.latest = {}
+        self.lossless = 0
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+
+        self.merged = metrics.counter("frames_conflated_total", "Frames replaced by a newer one before being processed", stream=name)
+        metrics.gauge("frame_queue_depth", "Frames waiting to be processed", lambda: len(self.pending), stream=name)
+
+    def __len__(self):
+        return len(self.pending)
+
+    async def put(self, key, item):
+        if key in self.conflate:
+            if key in self.latest:
+                self.merged.inc()
+            else:
+                self.pending.append((key, _CONFLATED))
+                self.ready.set()
+            self.latest[key] = item
+            return
+
+        while self.lossless >= self.maxsize:
+            self.space.clear()
+            await self.space.wait()
+
+        self.pending.append((key, item))
+        self.lossless += 1
+        self.ready.set()
+
+    async def get(self):
+        while not self.pending:
+            self.ready.clear()
+            await self.ready.wait()
+
+        key, item = self.pending.popleft()
+        if item is _CONFLATED:
+            item = self.latest.pop(key)
+        else:
+            self.lossless -= 1
+            self.space.set()
+        return key, item
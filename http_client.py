@@ -0,0 +1,97 @@
+import asyncio
+import time
+import aiohttp
+
+BASE_URL = 'https://fapi.binance.com'
+
+MAX_CONNECTIONS = 10
+MAX_CONCURRENT_REQUESTS = 10
+KEEPALIVE_TIMEOUT = 60
+REQUEST_TIMEOUT = 10
+
+WEIGHT_LIMIT = 2400  # Request weight allowed per window on USD-M futures
+WEIGHT_WINDOW = 60
+WEIGHT_HEADROOM = 0.8  # Stop sending once this share of the limit is used
+DEFAULT_RETRY_AFTER = 60
+
+
+class BinanceClient:
+    """Shared REST client with a keep-alive connection pool and request weight pacing.
+
+    Concurrency is capped by a semaphore and by the connector pool size. Used
+    weight is estimated locally as requests go out and corrected from the
+    X-MBX-USED-WEIGHT-* response headers; once it reaches the headroom share
+    of WEIGHT_LIMIT, requests wait for the next weight window. 429/418
+    responses pause all requests for the Retry-After period.
+    """
+
+    def __init__(self, base_url=BASE_URL, max_connections=MAX_CONNECTIONS, max_concurrent=MAX_CONCURRENT_REQUESTS,
+                 weight_limit=WEIGHT_LIMIT, weight_window=WEIGHT_WINDOW):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.session = None
+
+        self.weight_limit = weight_limit
+        self.weight_window = weight_window
+        self.used_weight = 0
+        self.window_start = self._window_start(time.time())
+        self.paused_window = None
+        self.backoff_until = 0
+
+    def _window_start(self, now):
+        return now - now % self.weight_window
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=KEEPALIVE_TIMEOUT)
+            timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.session
+
+    async def _reserve_weight(self, weight):
+        while True:
+            now = time.time()
+
+            window_start = self._window_start(now)
+            if window_start != self.window_start:
+                self.window_start = window_start
+                self.used_weight = 0
+
+            if now < self.backoff_until:
+                await asyncio.sleep(self.backoff_until - now)
+                continue
+
+            if self.used_weight + weight <= self.weight_limit * WEIGHT_HEADROOM:
+                self.used_weight += weight
+                return
+
+            if self.paused_window != self.window_start:
+                self.paused_window = self.window_start
+                print(f"Request weight {self.used_weight}/{self.weight_limit} used, pausing until next window")
+            await asyncio.sleep(self.window_start + self.weight_window - now)
+
+    def _record_weight(self, headers):
+        for name, value in headers.items():
+            if name.lower().startswith("x-mbx-used-weight"):
+                # The server count includes requests other processes made from this IP
+                self.used_weight = max(self.used_weight, int(value))
+
+    async def get(self, path, params=None, weight=1):
+        async with self.semaphore:
+            await self._reserve_weight(weight)
+
+            session = self._get_session()
+            async with session.get(f'{self.base_url}{path}', params=params) as response:
+                self._record_weight(response.headers)
+
+                if response.status in (418, 429):
+                    retry_after = int(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER))
+                    self.backoff_until = max(self.backoff_until, time.time() + retry_after)
+
+                response.raise_for_status()
+                return await response.json()
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
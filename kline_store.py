@@ -0,0 +1,317 @@
+"""Local kline history, one column file per field, symbol and interval.
+
+    python kline_store.py sync --days 90
+    python kline_store.py compact --keep-days 365
+
+Candles live under <directory>/<interval>/<symbol>/<generation>/<field>.bin
+as raw little-endian arrays, appended in open time order, and the file
+<symbol>/CURRENT names the generation in use. sync() only downloads
+candles newer than the last stored one, reads come back as np.memmap slices
+of the files without copying, and compact() writes the candles within the
+retention to a new generation and switches CURRENT over to it in one
+rename, so a reader never mixes columns of two generations. A crash between
+column appends leaves some columns a candle longer; readers only see the
+shortest column and the next append trims the others.
+"""
+import argparse
+import asyncio
+import fcntl
+import os
+import shutil
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+import numpy as np
+from http_client import BinanceClient
+
+KLINE_DIR = "klines"
+CURRENT = "CURRENT"  # File naming a symbol's current generation directory
+LOCK = ".lock"  # Taken by append and compact, so a compaction never switches generations under an append
+INTERVAL = "1m"
+INTERVAL_MS = {"1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000, "30m": 1800000,
+               "1h": 3600000, "2h": 7200000, "4h": 14400000, "1d": 86400000}
+FETCH_LIMIT = 1500  # Candles per REST request, the maximum
+# Request weight of klines by limit: (largest limit, weight), the cheapest tier that fits is charged
+FETCH_WEIGHTS = [(99, 1), (499, 2), (1000, 5), (FETCH_LIMIT, 10)]
+HISTORY_DAYS = 30  # Downloaded for a symbol with nothing stored yet
+RETENTION_DAYS = 365
+
+# Field -> dtype in REST kline order; the trailing "ignore" field is dropped
+FIELDS = [
+    ("open_time", "<i8"),
+    ("open", "<f8"),
+    ("high", "<f8"),
+    ("low", "<f8"),
+    ("close", "<f8"),
+    ("volume", "<f8"),
+    ("close_time", "<i8"),
+    ("quote_volume", "<f8"),
+    ("trades", "<i8"),
+    ("taker_buy_volume", "<f8"),
+    ("taker_buy_quote_volume", "<f8"),
+]
+Klines = namedtuple("Klines", [name for name, _ in FIELDS])
+
+# Websocket kline payload keys of the same fields
+STREAM_KEYS = ["t", "o", "h", "l", "c", "v", "T", "q", "n", "V", "Q"]
+
+
+def fetch_weight(limit):
+    return next(weight for largest, weight in FETCH_WEIGHTS if limit <= largest)
+
+
+def rest_to_columns(klines):
+    """Columns of REST kline rows ([open time, "open", ...]) as arrays."""
+    return [np.array([kline[i] for kline in klines], dtype=dtype) for i, (_, dtype) in enumerate(FIELDS)]
+
+
+def stream_to_columns(kline):
+    """Columns of a single websocket kline payload (the "k" object)."""
+    return [np.array([kline[key]], dtype=dtype) for key, (_, dtype) in zip(STREAM_KEYS, FIELDS)]
+
+
+class KlineStore:
+    """Kline columns on disk, memory mapped for reading.
+
+    Appends and compactions of a symbol take turns on its lock file, so
+    kline_store.py compact can run next to a process that keeps appending.
+    Readers take no lock, any number may read.
+    """
+
+    def __init__(self, directory=KLINE_DIR, interval=INTERVAL):
+        self.directory = os.path.join(directory, interval)
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.maps = {}  # Symbol -> (generation, length, Klines of memmaps)
+        self.written = {}  # Symbol -> last open time, kept by the appending process instead of stat'ing the files
+
+    def _generation(self, symbol):
+        try:
+            with open(os.path.join(self.directory, symbol, CURRENT)) as file:
+                return file.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _set_generation(self, symbol, generation):
+        # Readers switch over to the new generation in one step
+        path = os.path.join(self.directory, symbol, CURRENT)
+        with open(path + ".tmp", "w") as file:
+            file.write(generation)
+        os.replace(path + ".tmp", path)
+
+    @contextmanager
+    def _lock(self, symbol):
+        symbol_dir = os.path.join(self.directory, symbol)
+        os.makedirs(symbol_dir, exist_ok=True)
+        with open(os.path.join(symbol_dir, LOCK), "a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def _path(self, symbol, generation, field):
+        return os.path.join(self.directory, symbol, generation, f"{field}.bin")
+
+    def symbols(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if not name.startswith("."))
+
+    def _sizes(self, symbol, generation):
+        sizes = []
+        for field, dtype in FIELDS:
+            path = self._path(symbol, generation, field)
+            sizes.append(os.path.getsize(path) // np.dtype(dtype).itemsize if os.path.exists(path) else 0)
+        return sizes
+
+    def length(self, symbol):
+        """Candles stored for symbol, checked on disk so appends of another process show up."""
+        generation = self._generation(symbol)
+        return min(self._sizes(symbol, generation)) if generation is not None else 0
+
+    def _trim(self, symbol, generation):
+        # Only the appending process may do this, a reader could cut into an append in progress
+        sizes = self._sizes(symbol, generation)
+        length = min(sizes)
+        for (field, dtype), size in zip(FIELDS, sizes):
+            if size > length:
+                os.truncate(self._path(symbol, generation, field), length * np.dtype(dtype).itemsize)
+
+    def last_open_time(self, symbol):
+        open_time = self.columns(symbol).open_time
+        return int(open_time[-1]) if len(open_time) else None
+
+    def _last_written(self, symbol):
+        # The first append of a process trims what a crash left behind, later ones go by the cached open time
+        if symbol not in self.written:
+            generation = self._generation(symbol)
+            if generation is not None:
+                self._trim(symbol, generation)
+            self.written[symbol] = self.last_open_time(symbol)
+        return self.written[symbol]
+
+    def append(self, symbol, columns, follow_only=False):
+        """Append candle columns (in FIELDS order) newer than the last stored one, return how many.
+
+        With follow_only, nothing is appended unless the first candle directly follows the last stored one.
+        """
+        with self._lock(symbol):
+            last = self._last_written(symbol)
+            if follow_only and (last is None or columns[0][0] != last + self.interval_ms):
+                return 0
+            if last is not None:
+                newer = columns[0] > last
+                columns = [column[newer] for column in columns]
+
+            count = len(columns[0])
+            if not count:
+                return 0
+
+            # Looked up under the lock every time, a compaction of another process may have switched it
+            generation = self._generation(symbol)
+            if generation is None:
+                generation = "0"
+                os.makedirs(os.path.join(self.directory, symbol, generation), exist_ok=True)
+                self._set_generation(symbol, generation)
+
+            for (field, dtype), column in zip(FIELDS, columns):
+                with open(self._path(symbol, generation, field), "ab") as file:
+                    file.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+            self.written[symbol] = int(columns[0][-1])
+            return count
+
+    def append_next(self, symbol, columns):
+        """Append a single candle only if it directly follows the last stored one.
+
+        Live candles arriving while the history has a hole are skipped, sync()
+        fills the hole and everything after it in one go.
+        """
+        return self.append(symbol, columns, follow_only=True)
+
+    def columns(self, symbol):
+        """Every stored candle of symbol as Klines of read-only memmaps, remapped when the files grew."""
+        generation = self._generation(symbol)
+        length = min(self._sizes(symbol, generation)) if generation is not None else 0
+        mapped = self.maps.get(symbol)
+        if mapped is not None and mapped[:2] == (generation, length):
+            return mapped[2]
+
+        if not length:
+            klines = Klines(*(np.empty(0, dtype=dtype) for _, dtype in FIELDS))
+        else:
+            klines = Klines(*(np.memmap(self._path(symbol, generation, field), dtype=dtype, mode="r", shape=(length,))
+                              for field, dtype in FIELDS))
+        self.maps[symbol] = (generation, length, klines)
+        return klines
+
+    def range(self, symbol, start=None, end=None):
+        """Candles with start <= open time < end (ms since epoch), as zero-copy slices of the memmaps."""
+        klines = self.columns(symbol)
+        first = 0 if start is None else int(np.searchsorted(klines.open_time, start, side="left"))
+        last = len(klines.open_time) if end is None else int(np.searchsorted(klines.open_time, end, side="left"))
+        return Klines(*(column[first:last] for column in klines))
+
+    def tail(self, symbol, count):
+        """The last count candles of symbol, as zero-copy slices."""
+        return Klines(*(column[-count:] if count else column[:0] for column in self.columns(symbol)))
+
+    async def sync(self, client, symbol, history_days=HISTORY_DAYS):
+        """Download the closed candles after the last stored one, or history_days of them for a new symbol."""
+        last = self._last_written(symbol)
+        start = last + self.interval_ms if last is not None else int((time.time() - history_days * 86400) * 1000)
+        added = 0
+
+        while True:
+            # Only as many candles as closed since start are asked for, a store kept current costs no request
+            # and a short gap the lowest weight
+            missing = int(time.time() * 1000 - start) // self.interval_ms
+            if missing <= 0:
+                return added
+
+            limit = min(missing + 1, FETCH_LIMIT)
+            params = {'symbol': symbol, 'interval': self.interval, 'startTime': start, 'limit': limit}
+            klines = await client.get('/fapi/v1/klines', params=params, weight=fetch_weight(limit))
+
+            # The last candle is usually still open, it is stored once it closed
+            now = time.time() * 1000
+            closed = [kline for kline in klines if kline[6] < now]
+            if not closed:
+                return added
+
+            added += self.append(symbol, rest_to_columns(closed))
+            start = closed[-1][0] + self.interval_ms
+            if len(klines) < limit:
+                return added
+
+    async def sync_all(self, client, symbols, history_days=HISTORY_DAYS):
+        results = await asyncio.gather(*(self.sync(client, symbol, history_days) for symbol in symbols), return_exceptions=True)
+        added = 0
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                print(f"Kline sync failed for {symbol}: {result}")
+            else:
+                added += result
+        return added
+
+    def compact(self, symbol, keep_days=RETENTION_DAYS):
+        """Drop the candles older than keep_days, return how many were removed."""
+        with self._lock(symbol):
+            cutoff = int((time.time() - keep_days * 86400) * 1000)
+            generation = self._generation(symbol)
+            klines = self.columns(symbol)
+            first = int(np.searchsorted(klines.open_time, cutoff, side="left"))
+            if not first:
+                return 0
+
+            # The kept candles go to a new generation that CURRENT then points at. Readers see either all
+            # old or all new columns, and keep the old mappings they have. The generation before the
+            # current one is left for readers that looked it up just before the switch.
+            symbol_dir = os.path.join(self.directory, symbol)
+            new_generation = str(int(generation) + 1)
+            shutil.rmtree(os.path.join(symbol_dir, new_generation), ignore_errors=True)
+            os.makedirs(os.path.join(symbol_dir, new_generation))
+            for (field, _), column in zip(FIELDS, klines):
+                with open(self._path(symbol, new_generation, field), "wb") as file:
+                    file.write(column[first:].tobytes())
+            self._set_generation(symbol, new_generation)
+
+            for name in os.listdir(symbol_dir):
+                if name not in (CURRENT, generation, new_generation) and os.path.isdir(os.path.join(symbol_dir, name)):
+                    shutil.rmtree(os.path.join(symbol_dir, name), ignore_errors=True)
+
+            self.maps.pop(symbol, None)
+            return first
+
+    def compact_all(self, keep_days=RETENTION_DAYS):
+        return sum(self.compact(symbol, keep_days) for symbol in self.symbols())
+
+
+async def sync_market(store, symbols=None, history_days=HISTORY_DAYS):
+    client = BinanceClient()
+    try:
+        if not symbols:
+            exchange_info = await client.get('/fapi/v1/exchangeInfo')
+            symbols = [symbol['symbol'] for symbol in exchange_info['symbols']
+                       if symbol['quoteAsset'] == 'USDT' and 'PERPETUAL' in symbol['contractType']]
+
+        started = time.time()
+        added = await store.sync_all(client, symbols, history_days)
+        print(f"Synced {added} {store.interval} candles for {len(symbols)} symbols in {time.time() - started:.1f}s")
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["sync", "compact"])
+    parser.add_argument("--dir", default=KLINE_DIR)
+    parser.add_argument("--interval", default=INTERVAL, choices=list(INTERVAL_MS))
+    parser.add_argument("--symbols", nargs="+", help="default: every USDT perpetual")
+    parser.add_argument("--days", type=int, default=HISTORY_DAYS, help="history downloaded for symbols with nothing stored yet")
+    parser.add_argument("--keep-days", type=int, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    store = KlineStore(args.dir, args.interval)
+    if args.command == "sync":
+        asyncio.run(sync_market(store, args.symbols, args.days))
+    else:
+        removed = store.compact_all(args.keep_days)
+        print(f"Removed {removed} candles older than {args.keep_days} days")
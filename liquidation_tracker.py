@@ -1,17 +1,15 @@
+import argparse
 import asyncio
-import csv
-from datetime import datetime, timedelta
-import json
-import os
-import re
 import time
-import traceback
-import tempfile
-import simpleaudio as sa
-import websockets
-
-COOLDOWN_TIME = 2
-cooldown_start = time.time()
+from datetime import datetime
+from decoders import decode_force_order
+from liquidation_windows import LiquidationAggregator, LONG, SHORT, MARKET
+from sound_engine import SoundEngine
+from symbol_registry import SymbolRegistry
+from recorder import FrameRecorder
+from market_hub import HUB_SOCKET, consume
+from reconnect import supervise
+import metrics
 
 TRESHOLD = 10000
 
@@ -19,6 +17,12 @@ MINI_TRESHOLD = 3000
 
 EXCLUDED = ["BTC", "SOL", "ETH", "XEM"]
 
+# Liquidated notional per side within a window that counts as a cascade
+CASCADE_THRESHOLDS = {"10s": 30000, "1m": 80000, "5m": 200000, "1h": 1000000}
+MARKET_CASCADE_THRESHOLDS = {"10s": 1000000, "1m": 3000000, "5m": 10000000, "1h": 50000000}
+
+aggregator = LiquidationAggregator(CASCADE_THRESHOLDS, MARKET_CASCADE_THRESHOLDS)
+
 SOUND_FILE = "sounds/liquidation.wav"
 
 SOUND_NORMAL = "sounds/alarm_normal.wav"
@@ -26,67 +30,50 @@ SOUND_HIGHER = "sounds/alarm_higher.wav"
 SOUND_MAX = "sounds/alarm_max.wav"
 SOUND_NEW_SYMBOL = "sounds/symbol.wav"
 
-SYMBOL_LIST_FILE = "symbol_list.csv"
-
-def read_symbol_list_csv():
-    if os.path.exists(SYMBOL_LIST_FILE):
-        with open(SYMBOL_LIST_FILE, 'r', newline='') as file:
-            reader = csv.reader(file)
-            symbol_list = [symbol for row in reader for symbol in row]
-        return symbol_list
-    else:
-        return []
-    
-
-def sanitize_symbol(symbol: str) -> str:
-    return re.sub(r'[^A-Za-z0-9+\-._/]', '', symbol)
-
-def write_symbol_list_csv(symbol_list):
-    # Clean the symbols before writing
-    clean_list = [sanitize_symbol(s) for s in symbol_list]
+# Lower number wins, a more important alarm cuts off a less important one
+SOUND_PRIORITIES = {
+    SOUND_MAX: 0,
+    SOUND_HIGHER: 1,
+    SOUND_NORMAL: 2,
+    SOUND_FILE: 3,
+    SOUND_NEW_SYMBOL: 4,
+}
 
-    # Create a temporary file in the same directory
-    dir_name = os.path.dirname(SYMBOL_LIST_FILE) or "."
-    fd, temp_path = tempfile.mkstemp(dir=dir_name, prefix="symbols_", suffix=".tmp")
+# Seconds between two sounds of the same priority
+SOUND_COOLDOWNS = {0: 0.5, 1: 1, 2: 2, 3: 2, 4: 2}
 
-    try:
-        with os.fdopen(fd, "w", newline='', encoding="utf-8") as tmp_file:
-            writer = csv.writer(tmp_file)
-            writer.writerow(clean_list)
+sound_engine = SoundEngine(SOUND_COOLDOWNS)
 
-        # Only replace original after successful write
-        os.replace(temp_path, SYMBOL_LIST_FILE)
+SYMBOL_LIST_FILE = "symbol_list.csv"
+SYMBOL_JOURNAL_FILE = "symbol_list.journal"
 
-    except Exception as e:
-        # Cleanup temp file on error
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        raise e
+symbol_registry = SymbolRegistry(SYMBOL_LIST_FILE, SYMBOL_JOURNAL_FILE)
 
-symbol_list = read_symbol_list_csv()
+latency = metrics.StreamLatency("forceOrder")
+metrics.gauge("sound_queue_depth", "Sounds waiting for the sound engine", sound_engine.queue.qsize)
 
 def play_sound(sound_file):
-    global cooldown_start
-    current_time = time.time()
+    # Queued for the sound engine's worker, never blocks the event loop
+    sound_engine.play(sound_file, SOUND_PRIORITIES[sound_file])
 
-    # cooldown
-    if current_time - cooldown_start <= COOLDOWN_TIME:
-        return
 
-    cooldown_start = current_time
+def notify_cascades(alerts, ts):
+    for alert in alerts:
+        if alert.symbol != MARKET and alert.symbol[:3] in EXCLUDED:
+            continue
 
-    try:
-        wave_obj = sa.WaveObject.from_wave_file(sound_file)
-        wave_obj.play()
-    except Exception as e:
-        print(f"Sound error: {e}")
+        dt = datetime.fromtimestamp(ts // 1000)
+        colored_output = f"{dt} {get_data_color(alert.symbol)}{alert.symbol} {get_direction_color(alert.side)}{alert.side}\033[0m cascade \033[94m${int(alert.total)}\033[0m liquidated in {alert.window}"
+
+        print(colored_output)
+        print()
+        latency.alerted()
 
+        play_sound(SOUND_HIGHER if alert.symbol == MARKET else SOUND_NORMAL)
 
-def calc_liq_amount(liq_data):
-    price = float(liq_data["p"])
-    quantity = float(liq_data["q"])
 
-    liq_amount = price * quantity
+def calc_liq_amount(order):
+    liq_amount = order.price * order.quantity
 
     return liq_amount
 
@@ -131,95 +118,95 @@ def get_liq_amount_color(liq_amount, s_prefix):
 
 
 
-async def ws_connect(endpoint):
-    reconnect_attempts = 0
+def handle_force_order(order):
+    symbol = order.symbol
+
+    percent_liq = percentage_difference(order.average_price, order.price)
 
-    while True:
-        try:
-            async with websockets.connect(endpoint) as ws:
-                print(f"Connected to {endpoint} successfully!")
+    liq_amount = calc_liq_amount(order)
 
-                # Subscribe to depth stream for each symbol
-                depth_stream_name = f"!forceOrder@arr"
-                subscribe_msg = {
-                    "method": "SUBSCRIBE",
-                    "params": [depth_stream_name],
-                    "id": 1
-                }
-                await ws.send(json.dumps(subscribe_msg))
+    # Window totals catch cascades of liquidations that are small one by one
+    side = SHORT if order.side == "BUY" else LONG
+    notify_cascades(aggregator.add(symbol, side, liq_amount, order.trade_time / 1000), order.trade_time)
 
-                while True:
-                    message = await ws.recv()
-                    data = json.loads(message)
+    if symbol[-4:] == "USDT" and symbol_registry.add(symbol):
+        print(f"NEW SYMBOL \033[35m {symbol}\033[0m!")
+        print()
+        play_sound(SOUND_NEW_SYMBOL)
 
-                    if "stream" in data:
-                        stream_name = data["stream"]
-                        if "@arr" in stream_name:
-                            data = data["data"]["o"]
+    symbol_registry.maybe_compact()
 
-                            open_price = float(data["ap"])
-                            liq_price = float(data["p"])
+    if liq_amount >= TRESHOLD or (liq_amount >= MINI_TRESHOLD and symbol[:3] not in EXCLUDED):
+        # Only build the timestamp for events that are actually printed
+        dt = datetime.fromtimestamp(order.trade_time // 1000)
 
-                            percent_liq = percentage_difference(open_price, liq_price)
+        direction = "SHORT" if order.side == "BUY" else "LONG"
+        colored_output = f"{dt} {get_data_color(symbol)}{symbol} {get_direction_color(direction)}{direction}\033[0m liquidated {get_liq_amount_color(liq_amount, symbol[:3])}${int(liq_amount)}\033[0m {get_percentage_color(percent_liq)}{abs(round(percent_liq, 2))}%\033[0m"
 
-                            liq_amount = calc_liq_amount(data)
+        print(colored_output)
+        print()
+        latency.alerted()
 
-                            ts = data["T"]
+        if symbol[:3] not in EXCLUDED:
 
-                            seconds = ts // 1000
-                            milliseconds = ts % 1000
-                            dt_base = datetime.fromtimestamp(seconds)
-                            dt = dt_base + timedelta(milliseconds=milliseconds)
+            if liq_amount >= 100000:
+                play_sound(SOUND_MAX)
 
-                            if data['s'][-4:] == "USDT" and data['s'] not in symbol_list:
-                                symbol_list.append(data['s'])
-                                print(f"NEW SYMBOL \033[35m {data['s']}\033[0m!")
-                                print()
-                                play_sound(SOUND_NEW_SYMBOL)
+            elif liq_amount >= 50000:
+                play_sound(SOUND_HIGHER)
 
-                            if liq_amount >= TRESHOLD or (liq_amount >= MINI_TRESHOLD and data['s'][:3] not in EXCLUDED):
-                                dt = dt.replace(microsecond=0)
+            elif liq_amount >= 21000:
+                play_sound(SOUND_NORMAL)
 
-                                direction = "SHORT" if data['S'] == "BUY" else "LONG"
-                                colored_output = f"{dt} {get_data_color(data['s'])}{data['s']} {get_direction_color(direction)}{direction}\033[0m liquidated {get_liq_amount_color(liq_amount, data['s'][:3])}${int(liq_amount)}\033[0m {get_percentage_color(percent_liq)}{abs(round(percent_liq, 2))}%\033[0m"
+            elif liq_amount >= TRESHOLD or percent_liq > 2.5:
+                play_sound(SOUND_FILE)
 
-                                print(colored_output)
-                                print()
 
-                                if data['s'][:3] not in EXCLUDED:
+def handle_hub_event(label, order):
+    latency.decoded(order.event_time, time.time())
+    handle_force_order(order)
+    latency.done()
 
-                                    if liq_amount >= 100000:
-                                        play_sound(SOUND_MAX)
 
-                                    elif liq_amount >= 50000:
-                                        play_sound(SOUND_HIGHER)
+async def ws_connect(endpoint, recorder=None):
+    def on_message(message, received_at):
+        order = decode_force_order(message)
 
-                                    elif liq_amount >= 21000:
-                                        play_sound(SOUND_NORMAL)
-                                        
-                                    elif liq_amount >= TRESHOLD or percent_liq > 2.5:
-                                        play_sound(SOUND_FILE)
+        if order is not None:
+            latency.decoded(order.event_time, received_at)
+            handle_force_order(order)
+            latency.done()
 
-        except Exception as e:
-            print(f"Connection error: {e}")
-            traceback.print_exc()
-            reconnect_attempts += 1
-            if True:
-                print(f"Reconnecting... (Attempt {reconnect_attempts})")
-                await asyncio.sleep(10)  # Wait for 5 seconds before attempting to reconnect
-            else:
-                print("Maximum reconnection attempts reached. Exiting...")
-                break
+    # Liquidations can be quiet for minutes, only pings tell a dead connection apart.
+    # Binance has no REST history of liquidations, so a gap can't be backfilled
+    # Every liquidation counts, nothing is conflated
+    await supervise(endpoint, on_message, subscribe=["!forceOrder@arr"], recorder=recorder)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoint", default="wss://fstream.binance.com/stream?streams=!forceOrder@arr", help="websocket endpoint, e.g. a local replay.py server")
+    parser.add_argument("--hub", nargs="?", const=HUB_SOCKET, metavar="SOCKET", help="take decoded liquidations from a running market_hub.py instead")
+    parser.add_argument("--record", metavar="DIR", help="capture every raw frame to compressed segments in DIR, not with --hub (use market_hub.py --record)")
+    parser.add_argument("--metrics", type=int, metavar="PORT", help="serve Prometheus metrics on localhost:PORT")
+    args = parser.parse_args()
 
-    endpoint = "wss://fstream.binance.com/stream?streams=!forceOrder@arr"
+    if args.record and (args.hub):
+        parser.error("--record captures this tool's own connection, record in market_hub.py --record instead")
+    recorder = FrameRecorder(args.record, "forceOrder") if args.record else None
 
     try:
-        asyncio.get_event_loop().run_until_complete(ws_connect(endpoint))
+        if args.hub:
+            connection = consume(["forceOrder"], handle_hub_event, args.hub)
+        else:
+            connection = ws_connect(args.endpoint, recorder)
+        if args.metrics:
+            asyncio.ensure_future(metrics.serve(args.metrics))
+        asyncio.get_event_loop().run_until_complete(connection)
     except KeyboardInterrupt:
         # Catch a KeyboardInterrupt (e.g., Ctrl+C) to stop the loop gracefully
         print("Received KeyboardInterrupt, stopping the loop...")
     finally:
-        write_symbol_list_csv(symbol_list)
+        if recorder is not None:
+            recorder.close()
+        symbol_registry.close()
         print("Data fetching disrupted!")
\ No newline at end of file
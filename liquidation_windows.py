@@ -0,0 +1,149 @@
+from collections import namedtuple
+
+LONG = 0
+SHORT = 1
+SIDE_NAMES = ("LONG", "SHORT")
+
+MARKET = "MARKET"
+
+# Window name -> (bucket seconds, bucket count)
+WINDOWS = {
+    "10s": (1, 10),
+    "1m": (5, 12),
+    "5m": (10, 30),
+    "1h": (60, 60),
+}
+
+REARM_RATIO = 0.5  # A fired window alert re-arms once its total falls below this share of the threshold
+
+CascadeAlert = namedtuple("CascadeAlert", ["symbol", "window", "side", "total"])
+
+
+class TimeWheel:
+    """Long/short notional summed over a sliding window of fixed-size time buckets.
+
+    Memory is bucket_count slots regardless of event rate. Adding an event
+    clears the buckets the wheel moved past (at most bucket_count, amortised
+    O(1)) and keeps running totals, so reading the window is O(1).
+    """
+
+    def __init__(self, bucket_seconds, bucket_count):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.buckets = [[0.0, 0.0] for _ in range(bucket_count)]
+        self.totals = [0.0, 0.0]
+        self.current = None  # Absolute number of the newest bucket
+
+    def advance(self, ts):
+        bucket = int(ts // self.bucket_seconds)
+        if self.current is None:
+            self.current = bucket
+            return bucket
+
+        steps = bucket - self.current
+        if steps <= 0:
+            return bucket
+
+        if steps >= self.bucket_count:
+            for slot in self.buckets:
+                slot[LONG] = slot[SHORT] = 0.0
+            self.totals = [0.0, 0.0]
+        else:
+            for number in range(self.current + 1, bucket + 1):
+                slot = self.buckets[number % self.bucket_count]
+                self.totals[LONG] -= slot[LONG]
+                self.totals[SHORT] -= slot[SHORT]
+                slot[LONG] = slot[SHORT] = 0.0
+
+        self.current = bucket
+        return bucket
+
+    def add(self, ts, side, amount):
+        bucket = self.advance(ts)
+        if bucket <= self.current - self.bucket_count:
+            return  # Older than the whole window
+
+        self.buckets[bucket % self.bucket_count][side] += amount
+        self.totals[side] += amount
+
+    def total(self, side):
+        return self.totals[side]
+
+
+class LiquidationAggregator:
+    """Per-symbol and market-wide liquidation notional over several time windows.
+
+    add() updates a TimeWheel per window for the symbol and for the market,
+    then compares the side's window totals with the configured thresholds.
+    Each (symbol, window, side) alert fires once when its total crosses the
+    threshold and re-arms after the total drops below REARM_RATIO of it.
+    Windows are checked shortest first, and when one event fires a window,
+    longer windows it pushed over their thresholds are marked fired without
+    an alert of their own, so a single large liquidation alerts once.
+    """
+
+    def __init__(self, symbol_thresholds, market_thresholds, windows=WINDOWS):
+        self.windows = windows
+        self.symbol_thresholds = symbol_thresholds
+        self.market_thresholds = market_thresholds
+
+        self.market = self._new_wheels()
+        self.symbols = {}
+        self.fired = set()
+
+    def _new_wheels(self):
+        return {name: TimeWheel(bucket_seconds, bucket_count) for name, (bucket_seconds, bucket_count) in self.windows.items()}
+
+    def _rearm(self, key, wheels, thresholds, side):
+        # Against the totals before the new event: after a quiet spell a cascade whose first
+        # liquidation alone crosses the threshold must still alert
+        for name, threshold in thresholds.items():
+            if wheels[name].total(side) < threshold * REARM_RATIO:
+                self.fired.discard((key, name, side))
+
+    def _check(self, key, wheels, thresholds, side, alerts):
+        firing = False
+        for name in self.windows:
+            threshold = thresholds.get(name)
+            if threshold is None:
+                continue
+
+            total = wheels[name].total(side)
+            fired_key = (key, name, side)
+
+            if fired_key not in self.fired and total >= threshold:
+                self.fired.add(fired_key)
+                if not firing:
+                    alerts.append(CascadeAlert(key, name, SIDE_NAMES[side], total))
+                firing = True
+
+    def add(self, symbol, side, amount, ts):
+        """Record a liquidation and return the cascade alerts it triggered."""
+        wheels = self.symbols.get(symbol)
+        if wheels is None:
+            wheels = self.symbols[symbol] = self._new_wheels()
+
+        for name in self.windows:
+            wheels[name].advance(ts)
+            self.market[name].advance(ts)
+        self._rearm(symbol, wheels, self.symbol_thresholds, side)
+        self._rearm(MARKET, self.market, self.market_thresholds, side)
+
+        for name in self.windows:
+            wheels[name].add(ts, side, amount)
+            self.market[name].add(ts, side, amount)
+
+        alerts = []
+        self._check(symbol, wheels, self.symbol_thresholds, side, alerts)
+        self._check(MARKET, self.market, self.market_thresholds, side, alerts)
+        return alerts
+
+    def totals(self, symbol, window, ts):
+        """(long, short) notional of a symbol, or MARKET, in a window as of ts."""
+        wheels = self.market if symbol == MARKET else self.symbols.get(symbol)
+        if wheels is None:
+            return 0.0, 0.0
+
+        wheel = wheels[window]
+        wheel.advance(ts)
+        return wheel.total(LONG), wheel.total(SHORT)
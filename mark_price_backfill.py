@@ -0,0 +1,102 @@
+import asyncio
+import time
+from urllib.parse import urlparse
+import numpy as np
+from kline_store import FETCH_LIMIT, INTERVAL_MS, fetch_weight
+
+MIN_GAP_SECONDS = 3  # Shorter gaps only cost a few ticks of the window, not worth the REST calls
+TICK_SECONDS = 1  # !markPrice@arr pushes every second
+KLINE_INTERVAL = '1m'
+PREMIUM_INDEX_WEIGHT = 10
+
+
+def is_binance(endpoint):
+    """Whether endpoint is a Binance server; REST history only matches the stream of a live one, not a replay."""
+    host = urlparse(endpoint).hostname or ""
+    return host == "binance.com" or host.endswith(".binance.com")
+
+
+class MarkPriceBackfill:
+    """Refills a PriceStore over a hole in the !markPrice@arr stream from REST mark-price klines.
+
+    seen() notes the event time of every frame. fill(), run on (re)connect,
+    fetches the 1m mark-price klines covering the time since the last frame,
+    or the whole window on a cold start, and builds one synthetic frame per
+    second in between, with prices interpolated between each kline's open
+    and close. The frames are fed to the store when the first live frame is
+    seen, minus those at or after its event time, so ticks that arrived
+    during the fill are not counted twice. Windows then resume without a
+    hole or a fresh warmup; the filled ticks are only as detailed as 1m
+    klines allow.
+    """
+
+    def __init__(self, price_store, client, quote="USDT", min_gap=MIN_GAP_SECONDS):
+        self.price_store = price_store
+        self.client = client
+        self.quote = quote
+        self.min_gap = min_gap
+        self.last_time = None
+        self.pending = None  # (ticks, symbols, price matrix) waiting for the first live frame
+
+    def seen(self, event_time):
+        """Note a live frame, call before it goes into the store."""
+        if self.pending is not None:
+            ticks, symbols, matrix = self.pending
+            self.pending = None
+            for row in matrix[ticks < event_time / 1000]:
+                self.price_store.update(symbols, row)
+
+        self.last_time = event_time / 1000
+
+    async def _symbols(self):
+        if len(self.price_store):
+            return list(self.price_store.symbols)
+
+        mark_prices = await self.client.get('/fapi/v1/premiumIndex', weight=PREMIUM_INDEX_WEIGHT)
+        return sorted(entry["symbol"] for entry in mark_prices if entry["symbol"].endswith(self.quote))
+
+    async def _klines(self, symbol, start, end):
+        start_ms = int(start * 1000) - INTERVAL_MS[KLINE_INTERVAL]
+        end_ms = int(end * 1000)
+        # Without a limit Binance returns up to 500 klines and charges that tier, ask for only those in range
+        limit = min(FETCH_LIMIT, (end_ms - start_ms) // INTERVAL_MS[KLINE_INTERVAL] + 2)
+        params = {
+            'symbol': symbol,
+            'interval': KLINE_INTERVAL,
+            'startTime': start_ms,
+            'endTime': end_ms,
+            'limit': limit,
+        }
+        return await self.client.get('/fapi/v1/markPriceKlines', params=params, weight=fetch_weight(limit))
+
+    async def fill(self):
+        now = time.time()
+        window = self.price_store.window_size * TICK_SECONDS
+        since = now - window if self.last_time is None else max(self.last_time, now - window)
+        if now - since < self.min_gap:
+            return
+
+        ticks = np.arange(since + TICK_SECONDS, now, TICK_SECONDS)
+        if not len(ticks):
+            return
+
+        symbols = await self._symbols()
+        results = await asyncio.gather(*(self._klines(symbol, ticks[0], now) for symbol in symbols), return_exceptions=True)
+
+        filled_symbols = []
+        columns = []
+        for symbol, klines in zip(symbols, results):
+            if isinstance(klines, Exception) or not klines:
+                continue
+
+            # Open price at the open time, close price at the close time (or now for the running kline)
+            times = np.array([[kline[0] / 1000, min(kline[6] / 1000, now)] for kline in klines]).ravel()
+            prices = np.array([[float(kline[1]), float(kline[4])] for kline in klines]).ravel()
+            columns.append(np.interp(ticks, times, prices))
+            filled_symbols.append(symbol)
+
+        if not filled_symbols:
+            return
+
+        self.pending = (ticks, filled_symbols, np.column_stack(columns))
+        print(f"Backfilled {len(ticks)} ticks for {len(filled_symbols)} symbols from mark-price klines")
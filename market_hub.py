@@ -0,0 +1,310 @@
+"""One connection per stream group, decoded once, fanned out to every tool.
+
+    python market_hub.py
+    python top_movers.py --hub
+    python mover_trading.py --hub
+    python liquidation_tracker.py --hub
+
+With --shared-prices the hub also keeps the rolling mark-price window in
+shared memory (shared_prices.py), which top_movers.py --shared and
+mover_trading.py --shared read without any per-process decoding.
+
+The hub holds a single websocket per stream group, decodes every frame with
+decoders.py and hands the typed event (MarkPriceFrame, ForceOrder) to
+in-process subscribers and to local consumers connected over a Unix socket.
+A consumer sends the JSON list of group labels it wants, then reads
+length-prefixed JSON [label, fields] pairs. The socket is only accessible
+to the user running the hub and lives in a directory no one else can write
+to, by default $XDG_RUNTIME_DIR or a private directory under /tmp.
+"""
+import argparse
+import asyncio
+import json
+import os
+import stat
+import struct
+import tempfile
+import traceback
+import numpy as np
+import metrics
+from decoders import ForceOrder, MarkPriceFrame, decode_force_order, decode_mark_prices
+from frame_queue import FrameQueue
+from http_client import BinanceClient
+from mark_price_backfill import MarkPriceBackfill, is_binance
+from recorder import FrameRecorder
+from reconnect import backoff_delay, supervise
+from shared_prices import SHARED_PRICES_NAME, SharedPriceStore
+
+HUB_SOCKET = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or os.path.join(tempfile.gettempdir(), f"market_hub-{os.getuid()}"),
+                          "market_hub.sock")
+WS_BASE_URL = "wss://fstream.binance.com/stream?streams="
+
+# Group label -> combined stream path, each group is one upstream connection
+STREAM_GROUPS = {
+    "markPrice": "!markPrice@arr",
+    "forceOrder": "!forceOrder@arr",
+}
+# Silence that marks a connection dead; liquidations can be quiet for minutes, so only pings check those
+STALE_AFTER = {
+    "markPrice": 10,
+}
+# Snapshot groups where only the newest frame matters; every other group is passed on frame by frame
+CONFLATE = {"markPrice"}
+DECODERS = {
+    "markPrice": decode_mark_prices,
+    "forceOrder": decode_force_order,
+}
+
+SHARED_WINDOW = 60  # Seconds of mark prices kept in shared memory, the MAX_LEN of the tools reading it
+CLIENT_QUEUE_SIZE = 1000  # Events buffered per consumer before it is considered stuck and dropped
+HEADER = struct.Struct(">I")
+
+
+def encode_event(label, event):
+    """Wire format of a hub event: JSON [label, fields], so a consumer never runs anything it reads."""
+    if isinstance(event, MarkPriceFrame):
+        fields = [event.symbols, event.prices.tolist(), int(event.event_time)]
+    else:
+        fields = list(event)
+    return json.dumps([label, fields]).encode()
+
+
+def decode_event(payload):
+    label, fields = json.loads(payload)
+    if label == "markPrice":
+        symbols, prices, event_time = fields
+        return label, MarkPriceFrame(symbols, np.array(prices, dtype=np.float64), event_time)
+    if label == "forceOrder":
+        return label, ForceOrder(*fields)
+    raise ValueError(f"Unknown hub event group: {label}")
+
+
+def private_directory(path):
+    """Create the directory of the socket path with mode 0700, or check no one else can write to an existing one."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        info = os.lstat(directory)
+        # Whoever can create entries there could put their own socket in place of the hub's
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022:
+            raise PermissionError(f"{directory} must be a directory of the current user that no one else can write to")
+
+
+class MarketHub:
+    def __init__(self, groups=STREAM_GROUPS, base_url=WS_BASE_URL, record_dir=None, conflate=CONFLATE, stale_after=STALE_AFTER):
+        self.groups = groups
+        self.conflate = conflate
+        self.stale_after = stale_after
+        self.base_url = base_url
+        self.subscribers = {label: [] for label in groups}
+        self.clients = {}  # Queue -> labels of a connected consumer
+        self.recorders = {label: FrameRecorder(record_dir, label) for label in groups} if record_dir else {}
+        self.on_connect = {}  # Label -> coroutine function run after every (re)connect of the group
+        self.shared_prices = None
+        self.client = None
+
+        metrics.gauge("hub_consumers", "Connected hub consumers", lambda: len(self.clients))
+        metrics.gauge("hub_queue_depth", "Events queued for the slowest hub consumer",
+                      lambda: max((queue.qsize() for queue in self.clients), default=0))
+        self.dropped = metrics.counter("hub_consumers_dropped_total", "Hub consumers disconnected for falling behind")
+
+    def subscribe(self, label, callback):
+        """Call callback(event) in the hub process for every event of the group."""
+        self.subscribers[label].append(callback)
+
+    def share_mark_prices(self, name=SHARED_PRICES_NAME, window_size=SHARED_WINDOW, fill_gaps=True):
+        """Keep the rolling mark-price window in a SharedPriceStore that other processes attach to.
+
+        With fill_gaps, gaps after a reconnect are backfilled from REST, like the tools do for their own stores.
+        """
+        self.shared_prices = SharedPriceStore(window_size, name)
+        self.client = BinanceClient()
+        backfill = MarkPriceBackfill(self.shared_prices, self.client)
+
+        def update(frame):
+            backfill.seen(frame.event_time)
+            self.shared_prices.update(frame.symbols, frame.prices)
+
+        self.subscribe("markPrice", update)
+        if fill_gaps:
+            self.on_connect["markPrice"] = backfill.fill
+        print(f"Sharing {window_size}s mark-price windows as {name}")
+
+    def publish(self, label, event):
+        for callback in self.subscribers[label]:
+            callback(event)
+
+        payload = None
+        for queue, labels in list(self.clients.items()):
+            if label not in labels:
+                continue
+
+            # Serialized once however many consumers want it
+            if payload is None:
+                payload = encode_event(label, event)
+
+            try:
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                print(f"Hub consumer is {CLIENT_QUEUE_SIZE} events behind, disconnecting it")
+                self.dropped.inc()
+                del self.clients[queue]
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def stream_group(self, label):
+        decode = DECODERS[label]
+        recorder = self.recorders.get(label)
+        latency = metrics.StreamLatency(f"hub {label}")
+
+        def on_message(message, received_at):
+            # One bad frame must not cut every consumer off the stream
+            try:
+                event = decode(message)
+            except Exception as e:
+                print(f"Hub could not decode a {label} frame: {e}")
+                return
+
+            if event is not None:
+                latency.decoded(event.event_time, received_at)
+                self.publish(label, event)
+                latency.done()
+
+        await supervise(self.base_url + self.groups[label], on_message, stale_after=self.stale_after.get(label), name=f"hub {label}",
+                        conflate=label in self.conflate, recorder=recorder, on_connect=self.on_connect.get(label))
+
+    async def handle_client(self, reader, writer):
+        queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        try:
+            labels = set(json.loads(await reader.readline()))
+            self.clients[queue] = labels
+            print(f"Hub consumer subscribed to {sorted(labels)}")
+
+            while True:
+                payload = await queue.get()
+                if payload is None:
+                    break
+                writer.write(HEADER.pack(len(payload)) + payload)
+                await writer.drain()
+
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self.clients.pop(queue, None)
+            writer.close()
+
+    async def serve(self, path=HUB_SOCKET):
+        private_directory(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+        # Bound with mode 0600 already, no window where others could connect
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        finally:
+            os.umask(umask)
+        print(f"Hub listening on {path}")
+
+        try:
+            async with server:
+                await asyncio.gather(*(self.stream_group(label) for label in self.groups))
+        finally:
+            for recorder in self.recorders.values():
+                recorder.close()
+            if self.shared_prices is not None:
+                self.shared_prices.close()
+                await self.client.close()
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def hub_events(labels, path=HUB_SOCKET, on_connect=None):
+    """Yield (label, event) from a running hub for the given group labels.
+
+    The coroutine function on_connect runs once subscribed, before the first event is read.
+    """
+    reader, writer = await asyncio.open_unix_connection(path)
+    print(f"Connected to hub at {path}")
+    try:
+        writer.write((json.dumps(list(labels)) + "\n").encode())
+        await writer.drain()
+
+        if on_connect is not None:
+            await on_connect()
+
+        while True:
+            (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+            yield decode_event(await reader.readexactly(length))
+    finally:
+        writer.close()
+
+
+async def _handle_events(events, handler):
+    while True:
+        label, event = await events.get()
+        try:
+            handler(label, event)
+        except Exception as e:
+            print(f"Error handling a hub {label} event: {e}")
+            traceback.print_exc()
+
+
+async def consume(labels, handler, path=HUB_SOCKET, on_connect=None, conflate=CONFLATE):
+    """Call handler(label, event) for every hub event, reconnecting when the hub goes away.
+
+    The coroutine function on_connect runs after every (re)connect, e.g. to backfill a gap.
+    Events are read and handled by separate tasks; while the handler is busy, events of the
+    groups in conflate are replaced by newer ones, all others wait their turn.
+    """
+    reconnects = metrics.counter("hub_reconnects_total", "Reconnects to the market hub")
+    events = FrameQueue("hub consumer", conflate)
+    processor = asyncio.ensure_future(_handle_events(events, handler))
+    attempt = 0
+
+    try:
+        while True:
+            try:
+                async for label, event in hub_events(labels, path, on_connect):
+                    attempt = 0
+                    await events.put(label, event)
+            except Exception as e:
+                print(f"Hub connection error: {e}")
+                traceback.print_exc()
+
+            delay = backoff_delay(attempt)
+            attempt += 1
+            reconnects.inc()
+            await asyncio.sleep(delay)
+    finally:
+        processor.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=HUB_SOCKET, help="Unix socket consumers connect to")
+    parser.add_argument("--base-url", default=WS_BASE_URL, help="combined stream url the group paths are appended to")
+    parser.add_argument("--record", metavar="DIR", help="capture every raw frame to compressed segments in DIR")
+    parser.add_argument("--metrics", type=int, metavar="PORT", help="serve Prometheus metrics on localhost:PORT")
+    parser.add_argument("--lossless", action="store_true", help="pass on every frame instead of conflating a backlog; always on for a base url that isn't Binance")
+    parser.add_argument("--no-backfill", action="store_true", help="don't refill shared-price gaps from REST; always off for a base url that isn't Binance")
+    parser.add_argument("--shared-prices", nargs="?", const=SHARED_PRICES_NAME, metavar="NAME", help="publish mark-price windows in shared memory under NAME")
+    args = parser.parse_args()
+
+    live = is_binance(args.base_url)
+    hub = MarketHub(base_url=args.base_url, record_dir=args.record, conflate=CONFLATE if live and not args.lossless else (),
+                    stale_after=STALE_AFTER if live else {})
+    if args.shared_prices:
+        hub.share_mark_prices(args.shared_prices, fill_gaps=live and not args.no_backfill)
+
+    async def main():
+        if args.metrics:
+            asyncio.ensure_future(metrics.serve(args.metrics))
+        await hub.serve(args.socket)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Hub stopped")
@@ -0,0 +1,203 @@
+"""In-process metrics with a Prometheus text endpoint.
+
+    python top_movers.py --metrics 9100
+    curl localhost:9100/metrics
+
+Histograms have fixed buckets and only bump one counter per observation,
+counters and meters are plain integer adds, and gauges are read through a
+callback at scrape time, so instrumenting a frame costs a microsecond or
+two next to the hundreds it takes to decode one. Every metric lives in the
+module level registry, keyed by name and labels, and is created on first use.
+"""
+import asyncio
+import bisect
+import time
+
+METRICS_HOST = "127.0.0.1"  # Local only, nothing here is meant for the outside
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # Seconds
+
+registry = {}  # Name -> [type, help, {labels: metric}]
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    """Current value of callback(), read when scraped."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def samples(self, name, labels):
+        yield name, labels, self.callback()
+
+
+class Meter:
+    """Event counter that also knows how many events came in during the last full second."""
+
+    def __init__(self):
+        self.total = 0
+        self.second = 0
+        self.in_second = 0
+        self.last_second = 0
+
+    def mark(self, now, count=1):
+        second = int(now)
+        if second != self.second:
+            self.last_second = self.in_second if second == self.second + 1 else 0
+            self.second = second
+            self.in_second = 0
+        self.in_second += count
+        self.total += count
+
+    def rate(self):
+        # Nothing marked for a full second means the rate dropped to zero
+        return self.last_second if int(time.time()) <= self.second + 1 else 0
+
+    def samples(self, name, labels):
+        yield name + "_total", labels, self.total
+        yield name + "_per_second", labels, self.rate()
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield name + "_bucket", labels + (("le", bound),), cumulative
+        yield name + "_bucket", labels + (("le", "+Inf"),), self.count
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, self.count
+
+
+def _metric(kind, name, help_text, labels, make):
+    family = registry.setdefault(name, [kind, help_text, {}])
+    key = tuple(sorted(labels.items()))
+    metric = family[2].get(key)
+    if metric is None:
+        metric = family[2][key] = make()
+    return metric
+
+
+def counter(name, help_text, **labels):
+    return _metric("counter", name, help_text, labels, Counter)
+
+
+def meter(name, help_text, **labels):
+    return _metric("meter", name, help_text, labels, Meter)
+
+
+def histogram(name, help_text, buckets=LATENCY_BUCKETS, **labels):
+    return _metric("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+
+def gauge(name, help_text, callback, **labels):
+    metric = _metric("gauge", name, help_text, labels, lambda: Gauge(callback))
+    metric.callback = callback
+    return metric
+
+
+def exposition():
+    """The registry in the Prometheus text format."""
+    lines = []
+    for name, (kind, help_text, metrics) in sorted(registry.items()):
+        if kind == "meter":
+            # A meter is a counter and a gauge under two names
+            families = [(name + "_total", "counter", help_text), (name + "_per_second", "gauge", help_text + " in the last second")]
+        else:
+            families = [(name, kind, help_text)]
+
+        for family, family_kind, family_help in families:
+            lines.append(f"# HELP {family} {family_help}")
+            lines.append(f"# TYPE {family} {family_kind}")
+            for labels, metric in metrics.items():
+                for sample, sample_labels, value in metric.samples(name, labels):
+                    if kind != "meter" or sample == family:
+                        lines.append(f"{sample}{_labels(sample_labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class StreamLatency:
+    """Exchange -> receive -> decoded -> alert latencies of one stream.
+
+    The consumer takes the receive time first thing in its message callback,
+    calls decoded() with the exchange event time once the frame is decoded,
+    alerted() whenever handling that frame raises an alert and done() when
+    the frame is handled, so alerts raised outside a frame (e.g. by a REST
+    backfill) are not counted.
+    """
+
+    def __init__(self, stream):
+        self.frames = meter("frames", "Frames received", stream=stream)
+        self.exchange_to_receive = histogram("exchange_to_receive_seconds", "Exchange event time to local receive", stream=stream)
+        self.receive_to_decoded = histogram("receive_to_decoded_seconds", "Local receive to decoded event", stream=stream)
+        self.decoded_to_alert = histogram("decoded_to_alert_seconds", "Decoded event to raised alert", stream=stream)
+        self.decoded_at = None
+
+    def decoded(self, event_time, received_at):
+        now = time.time()
+        self.frames.mark(received_at)
+        # Clock skew against the exchange can make this slightly negative, that lands in the first bucket
+        self.exchange_to_receive.observe(received_at - event_time / 1000)
+        self.receive_to_decoded.observe(now - received_at)
+        self.decoded_at = now
+
+    def alerted(self):
+        if self.decoded_at is not None:
+            self.decoded_to_alert.observe(time.time() - self.decoded_at)
+
+    def done(self):
+        self.decoded_at = None
+
+
+async def handle_scrape(reader, writer):
+    try:
+        request = await reader.readline()
+        # Headers are not needed, only drained
+        while (await reader.readline()).strip():
+            pass
+
+        if request.split(b" ")[1:2] == [b"/metrics"]:
+            status, body = "200 OK", exposition().encode()
+        else:
+            status, body = "404 Not Found", b"Try /metrics\n"
+
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port, host=METRICS_HOST):
+    """Serve /metrics over HTTP on host:port until cancelled."""
+    server = await asyncio.start_server(handle_scrape, host, port)
+    print(f"Metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
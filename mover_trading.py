@@ -1,227 +1,210 @@
+import argparse
 import asyncio
 import random
-import heapq
-import json
 import time
 import traceback
-import websockets
-import numpy as np
-import pandas as pd
-from trade import TrailingStopLossTrade, ConstantStopLossTrade
+from decoders import decode_mark_prices
+from price_store import PriceStore
+from ranking import rank_movers
+from recorder import FrameRecorder
+from trade_book import TradeBook
+from results_writer import ResultsWriter
+from market_hub import CONFLATE, HUB_SOCKET, consume
+from http_client import BinanceClient
+from mark_price_backfill import MarkPriceBackfill, is_binance
+from reconnect import supervise
+from shared_prices import SHARED_PRICES_NAME, follow
+import metrics
 
-prices_dict = {}
 MAX_LEN = 60
+price_store = PriceStore(MAX_LEN)
 
-trades = []
-n_columns = 8
-data = np.array([]).reshape(0, n_columns)
+# Fills reconnect gaps and the warmup window from REST, so trading starts right away
+client = BinanceClient()
+backfill = MarkPriceBackfill(price_store, client)
+
+STALE_SECONDS = 10  # Mark prices arrive every second, this much silence means the connection is dead
+
+latency = metrics.StreamLatency("markPrice")
+TOP_COUNT = 5
+RECENT_LOOKUP = 3
+
+trade_book = TradeBook()
 
 def get_stop_loss(symbol, side_long, added_percentage):
     if side_long:
-        lowest_price = min(prices_dict[symbol])
+        lowest_price = price_store.window(symbol).min()
         return lowest_price - lowest_price * added_percentage / 100
     else:
-        highest_price = max(prices_dict[symbol])
+        highest_price = price_store.window(symbol).max()
         return highest_price + highest_price * added_percentage / 100
 
-def append_row(row_data):
-    global data
-    data = np.vstack([data, row_data])
-
 def get_trailing_percentage():
     trailing = 0.8
     return trailing
 
-def update_mark_price(symbol, price):
-    if symbol in prices_dict:
-        prices_dict[symbol].append(float(price))
-
-        if len(prices_dict[symbol]) > MAX_LEN:
-            prices_dict[symbol].pop(0)
-    else:
-        prices_dict[symbol] = [float(price)]
-
-def calculate_direction_of_change(symbol):
-    prices = prices_dict[symbol]
-    if len(prices) < 2:
-        return 0  # If there's only one price, we can't calculate the change
-    
-    # Calculate weighted average rate of change
-    weighted_sum = 0
-    total_weight = 0
-    for i in range(1, len(prices)):
-        weight = i / sum(range(1, len(prices)))  # Weight increases linearly with index
-        price_change = (prices[i] - prices[i - 1]) / prices[i - 1]  # Price change
-        weighted_sum += weight * price_change
-        total_weight += weight
-    return weighted_sum / total_weight if total_weight != 0 else 0
-
-def calculate_rate_of_change(symbol):
-    prices = prices_dict[symbol]
-    if len(prices) < 2:
-        return 0  # If there's only one price, we can't calculate the change
-    
-    # Calculate weighted average rate of change
-    weighted_sum = 0
-    total_weight = 0
-    for i in range(1, len(prices)):
-        weight = i / sum(range(1, len(prices)))  # Weight increases linearly with index
-        price_change = abs(prices[i] - prices[i - 1]) / prices[i - 1]  # Absolute price change
-        weighted_sum += weight * price_change
-        total_weight += weight
-    return weighted_sum / total_weight if total_weight != 0 else 0 
-
-
-def get_top_5_fastest_movers():
-    movers = []
-    for symbol in prices_dict:
-        rate_of_change = calculate_rate_of_change(symbol)
-        heapq.heappush(movers, (rate_of_change, symbol))
-        if len(movers) > 5:
-            heapq.heappop(movers)
-    return sorted(movers, reverse=True)
-
-def get_sorted_by_direction():
-    movers = []
-    for symbol in prices_dict:
-        direction = calculate_direction_of_change(symbol)
-        heapq.heappush(movers, (direction, symbol))
-    return sorted(movers)
-
-async def ws_connect(endpoint):
-    reconnect_attempts = 0
-
-    while True:
+def handle_mark_prices(frame, results):
+    backfill.seen(frame.event_time)
+    price_store.update(frame.symbols, frame.prices)
+    trade_on_prices(price_store, results)
+
+
+def trade_on_prices(store, results):
+    if "BTCUSDT" in store and store.count("BTCUSDT") >= MAX_LEN:
+        current_time = time.time()
+
+        # Every open trade is checked against the latest prices in one step
+        for trade in trade_book.check(store.lasts(), current_time):
+            results.append(trade)
+            latency.alerted()
+
+
+        # Rank every symbol in one pass
+        ranking = rank_movers(store, TOP_COUNT, RECENT_LOOKUP)
+
+        # for (rate_of_change, symbol) in ranking.fastest:
+        #     prices = store.window(symbol)
+        #     reason = False
+
+        #     if prices[-1] > prices[-20] and prices[-20] > prices[-40] and prices[-40] > prices[0]:
+        #         reason = "3 Bullish top"
+        #         long = False
+        #     elif prices[-1] > prices[-20] and prices[-20] > prices[-40]:
+        #         reason = "2 Bullish top"
+        #         long = False
+        #     elif prices[-1] < prices[-20] and prices[-20] < prices[-40] and prices[-40] < prices[0]:
+        #         reason = "3 Bearish top"
+        #         long = True
+        #     elif prices[-1] < prices[-20] and prices[-20] < prices[-40]:
+        #         reason = "2 Bearish top"
+        #         long = True
+
+        #     if reason:    
+        #         trade_book.open_trailing(symbol, store.index[symbol], prices[-1], 100, current_time, long, reason, get_trailing_percentage())
+
+        top_up = ranking.top_up
+        top_down = ranking.top_down
+
+        for (rate_of_change, symbol) in top_up:
+            prices = store.window(symbol)
+            reason = False
+
+            if prices[-1] > prices[-20] and prices[-20] > prices[-40] and prices[-40] > prices[0]:
+                reason = "3 Bullish bull"
+                long = True
+            elif prices[-1] > prices[-20] and prices[-20] > prices[-40]:
+                reason = "2 Bullish bull"
+                long = True
+
+            if reason:    
+                # if random.randint(1,2) == 2:
+                #     stop_loss_extra_percent_options = [0, 0, 0, 0.5, 0,5, 1, 1, 1.5, 2]
+                #     stop_loss_extra_percent = random.choice(stop_loss_extra_percent_options)
+                #     reason += " const"
+                #     trade_book.open_constant(symbol, store.index[symbol], prices[-1], 100, current_time, long, reason, get_stop_loss(symbol, long, stop_loss_extra_percent), stop_loss_extra_percent)
+                # else:
+                trade_book.open_trailing(symbol, store.index[symbol], prices[-1], 100, current_time, long, reason, get_trailing_percentage())
+                latency.alerted()
+
+        for (rate_of_change, symbol) in top_down:
+            prices = store.window(symbol)
+            reason = False
+
+            if prices[-1] < prices[-20] and prices[-20] < prices[-40] and prices[-40] < prices[0]:
+                reason = "3 Bearish bear"
+                long = False
+            elif prices[-1] < prices[-20] and prices[-20] < prices[-40]:
+                reason = "2 Bearish bear"
+                long = False
+
+            if reason:    
+                # if random.randint(1,2) == 2:
+                #     stop_loss_extra_percent_options = [0, 0, 0, 0.5, 0,5, 1, 1, 1.5, 2]
+                #     stop_loss_extra_percent = random.choice(stop_loss_extra_percent_options)
+                #     reason += " const"
+                #     trade_book.open_constant(symbol, store.index[symbol], prices[-1], 100, current_time, long, reason, get_stop_loss(symbol, long, stop_loss_extra_percent), stop_loss_extra_percent)
+                # else:
+                trade_book.open_trailing(symbol, store.index[symbol], prices[-1], 100, current_time, long, reason, get_trailing_percentage())
+                latency.alerted()
+
+
+def handle_hub_event(frame, results):
+    latency.decoded(frame.event_time, time.time())
+    handle_mark_prices(frame, results)
+    latency.done()
+
+
+async def ws_connect(endpoint, results, recorder=None, fill_gaps=True, conflate=True, stale_after=STALE_SECONDS):
+    def on_message(message, received_at):
+        frame = decode_mark_prices(message)
+
+        if frame is not None:
+            latency.decoded(frame.event_time, received_at)
+            handle_mark_prices(frame, results)
+            latency.done()
+
+    # Trades act on the newest prices, frames that piled up while checking are conflated
+    await supervise(endpoint, on_message, subscribe=["!markPrice@arr"], on_connect=backfill.fill if fill_gaps else None, stale_after=stale_after,
+                    conflate=conflate, recorder=recorder)
+
+
+async def follow_shared(name, results):
+    async for view in follow(name):
+        # Trading changes the book, so it runs on a consistent copy instead of retrying on the live view
+        store = view.snapshot()
         try:
-            async with websockets.connect(endpoint) as ws:
-                print(f"Connected to {endpoint} successfully!")
-
-                # Subscribe to depth stream for each symbol
-                depth_stream_name = f"!markPrice@arr"
-                subscribe_msg = {
-                    "method": "SUBSCRIBE",
-                    "params": [depth_stream_name],
-                    "id": 1
-                }
-                await ws.send(json.dumps(subscribe_msg))
-
-                while True:
-                    message = await ws.recv()
-                    data = json.loads(message)
-
-                    if "stream" in data:
-                        stream_name = data["stream"]
-                        if "!markPrice@arr" in stream_name:
-                            data = data["data"]
-                            for symbol_data in data:
-                                symbol = symbol_data["s"]
-                                price = float(symbol_data["p"])
-
-                                if symbol[-4:] == "USDT":
-                                    update_mark_price(symbol, price)
-
-                            
-                            if len(prices_dict["BTCUSDT"]) >= MAX_LEN:
-                                current_time = time.time()
-
-                                for trade in trades:
-                                    if trade.check(prices_dict[trade.symbol][-1], current_time):
-                                        profit_loss = trade.calculate_profit_loss()
-                                        append_row(np.array([trade.entry_reason, trade.symbol, trade.entry_time, trade.entry_price, trade.exit_time, trade.exit_price, trade.trailing_stop_loss_percentage, profit_loss]))
-                                        trades.remove(trade)
-
-
-                                # # Get top 5 fastest movers
-                                # top_5 = get_top_5_fastest_movers()
-
-                                # for (rate_of_change, symbol) in top_5:
-                                #     reason = False
-
-                                #     if prices_dict[symbol][-1] > prices_dict[symbol][-20] and prices_dict[symbol][-20] > prices_dict[symbol][-40] and prices_dict[symbol][-40] > prices_dict[symbol][0]:
-                                #         reason = "3 Bullish top"
-                                #         long = False
-                                #     elif prices_dict[symbol][-1] > prices_dict[symbol][-20] and prices_dict[symbol][-20] > prices_dict[symbol][-40]:
-                                #         reason = "2 Bullish top"
-                                #         long = False
-                                #     elif prices_dict[symbol][-1] < prices_dict[symbol][-20] and prices_dict[symbol][-20] < prices_dict[symbol][-40] and prices_dict[symbol][-40] < prices_dict[symbol][0]:
-                                #         reason = "3 Bearish top"
-                                #         long = True
-                                #     elif prices_dict[symbol][-1] < prices_dict[symbol][-20] and prices_dict[symbol][-20] < prices_dict[symbol][-40]:
-                                #         reason = "2 Bearish top"
-                                #         long = True
-
-                                #     if reason:    
-                                #         trade = TrailingStopLossTrade(symbol, prices_dict[symbol][-1], 100, current_time, long, reason, get_trailing_percentage())
-                                #         trades.append(trade)
-                                        
-                                # Get top 5 fastest movers
-                                movement_rates  = get_sorted_by_direction()
-
-                                top_up = movement_rates[-5:]
-                                top_down = movement_rates[:5]
-
-                                for (rate_of_change, symbol) in top_up:
-                                    reason = False
-
-                                    if prices_dict[symbol][-1] > prices_dict[symbol][-20] and prices_dict[symbol][-20] > prices_dict[symbol][-40] and prices_dict[symbol][-40] > prices_dict[symbol][0]:
-                                        reason = "3 Bullish bull"
-                                        long = True
-                                    elif prices_dict[symbol][-1] > prices_dict[symbol][-20] and prices_dict[symbol][-20] > prices_dict[symbol][-40]:
-                                        reason = "2 Bullish bull"
-                                        long = True
-
-                                    if reason:    
-                                        # if random.randint(1,2) == 2:
-                                        #     stop_loss_extra_percent_options = [0, 0, 0, 0.5, 0,5, 1, 1, 1.5, 2]
-                                        #     stop_loss_extra_percent = random.choice(stop_loss_extra_percent_options)
-                                        #     reason += " const"
-                                        #     trade = ConstantStopLossTrade(symbol, prices_dict[symbol][-1], 100, current_time, long, reason, get_stop_loss(symbol, long, stop_loss_extra_percent), stop_loss_extra_percent)
-                                        # else:
-                                        trade = TrailingStopLossTrade(symbol, prices_dict[symbol][-1], 100, current_time, long, reason, get_trailing_percentage())
-                                        trades.append(trade)
-
-                                for (rate_of_change, symbol) in top_down:
-                                    reason = False
-
-                                    if prices_dict[symbol][-1] < prices_dict[symbol][-20] and prices_dict[symbol][-20] < prices_dict[symbol][-40] and prices_dict[symbol][-40] < prices_dict[symbol][0]:
-                                        reason = "3 Bearish bear"
-                                        long = False
-                                    elif prices_dict[symbol][-1] < prices_dict[symbol][-20] and prices_dict[symbol][-20] < prices_dict[symbol][-40]:
-                                        reason = "2 Bearish bear"
-                                        long = False
-
-                                    if reason:    
-                                        # if random.randint(1,2) == 2:
-                                        #     stop_loss_extra_percent_options = [0, 0, 0, 0.5, 0,5, 1, 1, 1.5, 2]
-                                        #     stop_loss_extra_percent = random.choice(stop_loss_extra_percent_options)
-                                        #     reason += " const"
-                                        #     trade = ConstantStopLossTrade(symbol, prices_dict[symbol][-1], 100, current_time, long, reason, get_stop_loss(symbol, long, stop_loss_extra_percent), stop_loss_extra_percent)
-                                        # else:
-                                        trade = TrailingStopLossTrade(symbol, prices_dict[symbol][-1], 100, current_time, long, reason, get_trailing_percentage())
-                                        trades.append(trade)
-
-
+            # A restarted publisher numbers its rows anew
+            trade_book.remap(store.index)
+            trade_on_prices(store, results)
         except Exception as e:
-            print(f"Connection error: {e}")
+            print(f"Error trading on shared mark prices: {e}")
             traceback.print_exc()
-            reconnect_attempts += 1
-            if True:
-                print(f"Reconnecting... (Attempt {reconnect_attempts})")
-                await asyncio.sleep(10)  # Wait for 5 seconds before attempting to reconnect
-            else:
-                print("Maximum reconnection attempts reached. Exiting...")
-                break
 
-if __name__ == "__main__":
 
-    endpoint = "wss://fstream.binance.com/stream?streams=!markPrice@arr"
+async def run(connection):
+    try:
+        await connection
+    finally:
+        await client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoint", default="wss://fstream.binance.com/stream?streams=!markPrice@arr", help="websocket endpoint, e.g. a local replay.py server")
+    parser.add_argument("--hub", nargs="?", const=HUB_SOCKET, metavar="SOCKET", help="take decoded frames from a running market_hub.py instead")
+    parser.add_argument("--shared", nargs="?", const=SHARED_PRICES_NAME, metavar="NAME", help="trade on the mark-price windows a market_hub.py --shared-prices publishes")
+    parser.add_argument("--results", default="trade_testing_data.csv", help="CSV file closed trades are appended to")
+    parser.add_argument("--parquet", metavar="PATH", help="also write closed trades as Parquet part files to the directory PATH (needs pyarrow)")
+    parser.add_argument("--record", metavar="DIR", help="capture every raw frame to compressed segments in DIR, not with --hub (use market_hub.py --record)")
+    parser.add_argument("--lossless", action="store_true", help="handle every frame instead of conflating a backlog; always on for an endpoint that isn't Binance")
+    parser.add_argument("--no-backfill", action="store_true", help="don't refill gaps from REST; always off for an endpoint that isn't Binance")
+    parser.add_argument("--metrics", type=int, metavar="PORT", help="serve Prometheus metrics on localhost:PORT")
+    args = parser.parse_args()
+
+    if args.record and (args.hub or args.shared):
+        parser.error("--record captures this tool's own connection, record in market_hub.py --record instead")
+    recorder = FrameRecorder(args.record, "markPrice") if args.record else None
+    results = ResultsWriter(args.results, parquet_path=args.parquet)
 
     try:
-        asyncio.get_event_loop().run_until_complete(ws_connect(endpoint))
+        if args.shared:
+            connection = follow_shared(args.shared, results)
+        elif args.hub:
+            connection = consume(["markPrice"], lambda label, frame: handle_hub_event(frame, results), args.hub,
+                                 on_connect=None if args.no_backfill else backfill.fill, conflate=() if args.lossless else CONFLATE)
+        else:
+            # A replay is only deterministic if every frame is handled once and nothing comes from live REST;
+            # reconnecting to it on silence would send the recording again
+            live = is_binance(args.endpoint)
+            connection = ws_connect(args.endpoint, results, recorder, fill_gaps=live and not args.no_backfill,
+                                    conflate=live and not args.lossless, stale_after=STALE_SECONDS if live else None)
+        if args.metrics:
+            asyncio.ensure_future(metrics.serve(args.metrics))
+        asyncio.get_event_loop().run_until_complete(run(connection))
     except KeyboardInterrupt:
         # Catch a KeyboardInterrupt (e.g., Ctrl+C) to stop the loop gracefully
         print("Received KeyboardInterrupt, stopping the loop...")
     finally:
-        df = pd.DataFrame(data, columns=['Entry Reason', 'Symbol', 'Entry Time', 'Entry Price', 'Exit Time', 'Exit Price', 'Trailing Stop Loss', 'Profit/Loss'])
-        df.to_csv('trade_testing_data.csv', index=False)
+        if recorder is not None:
+            recorder.close()
+        results.close()
         print("Data fetching disrupted!")
\ No newline at end of file
@@ -0,0 +1,187 @@
+import numpy as np
+
+INITIAL_CAPACITY = 512
+RESYNC_INTERVAL = 1000  # Batched updates between full recomputes, keeps float drift bounded
+
+
+class PriceStore:
+    """Rolling mark-price windows for many symbols in one float64 ring buffer.
+
+    Each symbol owns a row of a preallocated symbols x window matrix; rows are
+    added as new symbols show up and the matrix doubles when it runs out of
+    rows. Alongside the prices it keeps the plain and index-weighted sums of
+    the relative price changes in every window, so the weighted direction and
+    rate of change for all symbols are available in O(1) per update.
+    """
+
+    def __init__(self, window_size, capacity=INITIAL_CAPACITY):
+        if window_size < 2:
+            raise ValueError("window_size must be at least 2")
+
+        self.window_size = window_size
+        self.symbols = []
+        self.index = {}
+
+        self.prices = np.zeros((capacity, window_size))
+        self.head = np.zeros(capacity, dtype=np.int64)  # Next write position per row
+        self.counts = np.zeros(capacity, dtype=np.int64)
+
+        self.direction_sum = np.zeros(capacity)
+        self.direction_weighted = np.zeros(capacity)
+        self.rate_sum = np.zeros(capacity)
+        self.rate_weighted = np.zeros(capacity)
+
+        self.updates = 0
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def _grow(self):
+        capacity = len(self.prices) * 2
+        for name in ("prices", "head", "counts", "direction_sum", "direction_weighted", "rate_sum", "rate_weighted"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _add_symbol(self, symbol):
+        row = len(self.symbols)
+        if row == len(self.prices):
+            self._grow()
+
+        self.symbols.append(symbol)
+        self.index[symbol] = row
+        return row
+
+    def rows_for(self, symbols):
+        rows = np.empty(len(symbols), dtype=np.int64)
+        for i, symbol in enumerate(symbols):
+            row = self.index.get(symbol)
+            rows[i] = self._add_symbol(symbol) if row is None else row
+        return rows
+
+    def update(self, symbols, prices):
+        """Append one price per symbol. Symbols must be unique within a batch."""
+        rows = self.rows_for(symbols)
+        prices = np.asarray(prices, dtype=np.float64)
+        width = self.window_size
+
+        head = self.head[rows]
+        counts = self.counts[rows]
+
+        # New change between the last stored price and the incoming one
+        previous = self.prices[rows, (head - 1) % width]
+        change = np.divide(prices - previous, previous, out=np.zeros_like(prices), where=counts > 0)
+        abs_change = np.abs(change)
+
+        self.direction_sum[rows] += change
+        self.direction_weighted[rows] += counts * change
+        self.rate_sum[rows] += abs_change
+        self.rate_weighted[rows] += counts * abs_change
+
+        # Full rows drop their oldest price; every remaining change moves one index down
+        full = counts == width
+        if full.any():
+            full_rows = rows[full]
+            oldest = self.prices[full_rows, head[full]]
+            following = self.prices[full_rows, (head[full] + 1) % width]
+            evicted = (following - oldest) / oldest
+
+            self.direction_weighted[full_rows] -= self.direction_sum[full_rows]
+            self.direction_sum[full_rows] -= evicted
+            self.rate_weighted[full_rows] -= self.rate_sum[full_rows]
+            self.rate_sum[full_rows] -= np.abs(evicted)
+
+        self.prices[rows, head] = prices
+        self.head[rows] = (head + 1) % width
+        self.counts[rows] = np.minimum(counts + 1, width)
+
+        self.updates += 1
+        if self.updates % RESYNC_INTERVAL == 0:
+            self.resync()
+
+    def ordered(self):
+        """Chronological copy of every window, oldest price first, zero padded on the right."""
+        size = len(self.symbols)
+        head = self.head[:size]
+        counts = self.counts[:size]
+
+        start = np.where(counts == self.window_size, head, 0)
+        columns = (start[:, None] + np.arange(self.window_size)) % self.window_size
+        return np.take_along_axis(self.prices[:size], columns, axis=1)
+
+    def recent(self, lookback):
+        """Last `lookback` prices of every row, oldest first, and a mask of rows holding that many."""
+        size = len(self.symbols)
+        head = self.head[:size]
+
+        columns = (head[:, None] + np.arange(-lookback, 0)) % self.window_size
+        prices = np.take_along_axis(self.prices[:size], columns, axis=1)
+        return prices, self.counts[:size] >= lookback
+
+    def resync(self):
+        size = len(self.symbols)
+        prices = self.ordered()
+        counts = self.counts[:size]
+
+        valid = np.arange(1, self.window_size) < counts[:, None]
+        changes = np.divide(prices[:, 1:] - prices[:, :-1], prices[:, :-1], out=np.zeros((size, self.window_size - 1)), where=valid)
+        weights = np.arange(1, self.window_size)
+
+        self.direction_sum[:size] = changes.sum(axis=1)
+        self.direction_weighted[:size] = (changes * weights).sum(axis=1)
+        self.rate_sum[:size] = np.abs(changes).sum(axis=1)
+        self.rate_weighted[:size] = (np.abs(changes) * weights).sum(axis=1)
+
+    def _total_weights(self):
+        changes = np.maximum(self.counts[:len(self.symbols)] - 1, 0)
+        return changes * (changes + 1) / 2
+
+    def directions(self):
+        """Weighted average of signed price changes for every row."""
+        total = self._total_weights()
+        weighted = self.direction_weighted[:len(self.symbols)]
+        return np.divide(weighted, total, out=np.zeros_like(weighted), where=total > 0)
+
+    def rates(self):
+        """Weighted average of absolute price changes for every row."""
+        total = self._total_weights()
+        weighted = self.rate_weighted[:len(self.symbols)]
+        return np.divide(weighted, total, out=np.zeros_like(weighted), where=total > 0)
+
+    def direction(self, symbol):
+        row = self.index[symbol]
+        changes = self.counts[row] - 1
+        if changes < 1:
+            return 0
+        return self.direction_weighted[row] / (changes * (changes + 1) / 2)
+
+    def rate(self, symbol):
+        row = self.index[symbol]
+        changes = self.counts[row] - 1
+        if changes < 1:
+            return 0
+        return self.rate_weighted[row] / (changes * (changes + 1) / 2)
+
+    def count(self, symbol):
+        return int(self.counts[self.index[symbol]])
+
+    def last(self, symbol):
+        row = self.index[symbol]
+        return float(self.prices[row, (self.head[row] - 1) % self.window_size])
+
+    def lasts(self):
+        """Latest price of every row."""
+        size = len(self.symbols)
+        return self.prices[np.arange(size), (self.head[:size] - 1) % self.window_size]
+
+    def window(self, symbol):
+        """Chronological copy of a symbol's prices, oldest first."""
+        row = self.index[symbol]
+        head = self.head[row]
+        if self.counts[row] < self.window_size:
+            return self.prices[row, :head].copy()
+        return np.concatenate((self.prices[row, head:], self.prices[row, :head]))
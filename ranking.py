@@ -0,0 +1,73 @@
+from collections import namedtuple
+
+import numpy as np
+
+MarketRanking = namedtuple("MarketRanking", ["fastest", "top_up", "top_down", "market_short", "recent_short"])
+
+
+def scale_percentage(price_percentage):
+    # Snap a 0-10 share to the bar scale, ignoring slivers at both ends
+    if price_percentage <= 0.3:
+        return 0
+    elif 9 < price_percentage < 9.7:
+        return 9
+    return round(price_percentage)
+
+
+def select(values, symbols, k, largest):
+    """Partially select the k smallest or largest values as (value, symbol) tuples sorted ascending."""
+    k = min(k, len(values))
+    if k == 0:
+        return []
+
+    # Keep everything tied with the k-th value so ties break on the symbol like a full sort would
+    if largest:
+        threshold = np.partition(values, len(values) - k)[len(values) - k]
+        rows = np.flatnonzero(values >= threshold)
+    else:
+        threshold = np.partition(values, k - 1)[k - 1]
+        rows = np.flatnonzero(values <= threshold)
+
+    ranked = sorted(zip(values[rows].tolist(), [symbols[row] for row in rows]))
+    return ranked[-k:] if largest else ranked[:k]
+
+
+def get_market_short_percentage(directions):
+    # Share of symbols that are flat or falling, on a 0-10 scale
+    count = len(directions)
+    non_positive = np.count_nonzero(directions <= 0)
+    if non_positive == count:
+        non_positive = -1  # No symbol is rising, same sentinel as find_first_positive_index
+
+    return scale_percentage(non_positive * 10 / count)
+
+
+def get_recent_bar_count(price_store, lookup_count):
+    # Share of symbols whose last lookup_count prices fell at least half of the time
+    prices, filled = price_store.recent(lookup_count)
+    negative_changes = np.count_nonzero(prices[:, 1:] <= prices[:, :-1], axis=1)
+    negative_count = np.count_nonzero(filled & (negative_changes >= (lookup_count - 1) / 2))
+
+    return scale_percentage(negative_count * 10 / len(price_store))
+
+
+def rank_movers(price_store, k, lookup_count):
+    """Rank every symbol in the store in one pass over the direction and rate arrays.
+
+    fastest holds the k largest absolute rates in descending order, top_up and
+    top_down the k largest and smallest directions in ascending order.
+    """
+    if not len(price_store):
+        return MarketRanking([], [], [], 0, 0)
+
+    symbols = price_store.symbols
+    directions = price_store.directions()
+    rates = price_store.rates()
+
+    return MarketRanking(
+        fastest=select(rates, symbols, k, largest=True)[::-1],
+        top_up=select(directions, symbols, k, largest=True),
+        top_down=select(directions, symbols, k, largest=False),
+        market_short=get_market_short_percentage(directions),
+        recent_short=get_recent_bar_count(price_store, lookup_count),
+    )
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import random
+import time
+import traceback
+import websockets
+import metrics
+from frame_queue import FrameQueue
+
+BACKOFF_INITIAL = 0.05  # Seconds before the first retry
+BACKOFF_MAX = 30
+STABLE_SECONDS = 60  # A connection that lived this long resets the backoff
+
+PING_INTERVAL = 10
+PING_TIMEOUT = 10
+
+
+def backoff_delay(attempt, initial=BACKOFF_INITIAL, maximum=BACKOFF_MAX):
+    """Full jitter exponential backoff: uniform between 0 and initial * 2^attempt, capped."""
+    return random.uniform(0, min(maximum, initial * 2 ** attempt))
+
+
+async def _process(frames, on_message, name):
+    while True:
+        _, (message, received_at) = await frames.get()
+        # A message that can't be handled must not take the connection down with it
+        try:
+            on_message(message, received_at)
+        except Exception as e:
+            print(f"Error handling a message from {name}: {e}")
+            traceback.print_exc()
+
+
+async def supervise(endpoint, on_message, subscribe=None, on_connect=None, stale_after=None, name=None, conflate=False,
+                    recorder=None):
+    """Keep a websocket to endpoint alive and pass every message to on_message(message, received_at).
+
+    Dead connections are caught by websocket pings, and when stale_after is
+    set, by no message arriving for that many seconds. Reconnects back off
+    exponentially with jitter, starting in the milliseconds. subscribe is a
+    list of stream names sent as a SUBSCRIBE request, and the coroutine
+    function on_connect runs after every (re)connect before messages are
+    read, e.g. to backfill what was missed.
+
+    Receiving and handling run as separate tasks joined by a FrameQueue, so
+    slow handling never leaves frames piling up in the socket. With conflate
+    set, a message still waiting to be handled is replaced by a newer one,
+    for snapshot streams like !markPrice@arr; otherwise every message is
+    handled in order. received_at is the time.time() the message came in.
+    A FrameRecorder passed as recorder captures every message as received,
+    including those conflated away.
+    """
+    name = name or endpoint
+    reconnects = metrics.counter("ws_reconnects_total", "Websocket reconnects", stream=name)
+    frames = FrameQueue(name, conflate=[name] if conflate else ())
+    processor = asyncio.ensure_future(_process(frames, on_message, name))
+    attempt = 0
+
+    try:
+        while True:
+            connected_at = None
+            try:
+                async with websockets.connect(endpoint, ping_interval=PING_INTERVAL, ping_timeout=PING_TIMEOUT) as ws:
+                    connected_at = time.monotonic()
+                    print(f"Connected to {name} successfully!")
+
+                    if subscribe:
+                        await ws.send(json.dumps({"method": "SUBSCRIBE", "params": subscribe, "id": 1}))
+
+                    if on_connect is not None:
+                        await on_connect()
+
+                    while True:
+                        if stale_after is None:
+                            message = await ws.recv()
+                        else:
+                            message = await asyncio.wait_for(ws.recv(), stale_after)
+                        received_at = time.time()
+                        if recorder is not None:
+                            recorder.record(message)
+                        await frames.put(name, (message, received_at))
+
+            except asyncio.TimeoutError:
+                print(f"No message from {name} in {stale_after}s, reconnecting")
+            except (websockets.ConnectionClosed, OSError) as e:
+                print(f"Connection error on {name}: {e}")
+            except Exception as e:
+                print(f"Connection error on {name}: {e}")
+                traceback.print_exc()
+
+            if connected_at is not None and time.monotonic() - connected_at >= STABLE_SECONDS:
+                attempt = 0
+
+            delay = backoff_delay(attempt)
+            attempt += 1
+            reconnects.inc()
+            print(f"Reconnecting to {name} in {delay:.2f}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+    finally:
+        processor.cancel()
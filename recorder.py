@@ -0,0 +1,143 @@
+import gzip
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+
+SEGMENT_SECONDS = 3600
+SEGMENT_BYTES = 256 * 1024 * 1024  # Uncompressed bytes per segment
+MAX_SEGMENTS = 24 * 7  # Oldest segments are deleted beyond this, keeps the disk footprint bounded
+INDEX_SUFFIX = ".index.json"
+
+
+def index_path(directory, stream):
+    return os.path.join(directory, f"{stream}{INDEX_SUFFIX}")
+
+
+def read_index(directory, stream):
+    path = index_path(directory, stream)
+    if not os.path.exists(path):
+        return []
+
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def write_index(directory, stream, index):
+    # Temp file and swap, the index is never seen half-written
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix="index_", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(index, tmp_file, indent=1)
+
+        os.replace(temp_path, index_path(directory, stream))
+
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise e
+
+
+class FrameRecorder:
+    """Writes raw websocket frames to rotating gzip segments from a background thread.
+
+    record() only stamps the frame with the receive time and queues it. The
+    writer thread appends "<receive ns>\\t<frame>" lines to the current
+    segment and rotates after SEGMENT_SECONDS or SEGMENT_BYTES. Segments are
+    listed in <stream>.index.json with their time range and frame count as
+    soon as they are opened, and the entry is completed when they close.
+    Only the newest MAX_SEGMENTS segments are kept.
+    """
+
+    def __init__(self, directory, stream, segment_seconds=SEGMENT_SECONDS, segment_bytes=SEGMENT_BYTES, max_segments=MAX_SEGMENTS):
+        self.directory = directory
+        self.stream = stream
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.queue = queue.SimpleQueue()
+        self.segment = None
+        self.worker = threading.Thread(target=self._run, name=f"recorder-{stream}", daemon=True)
+        self.worker.start()
+
+    def record(self, message):
+        if isinstance(message, bytes):
+            message = message.decode("utf-8")
+        self.queue.put((time.time_ns(), message))
+
+    def close(self):
+        """Flush queued frames and close the open segment."""
+        self.queue.put(None)
+        self.worker.join()
+
+    def _open_segment(self, received_ns):
+        name = f"{self.stream}-{received_ns}.txt.gz"
+        self.segment = {
+            "file": name,
+            "stream": self.stream,
+            "start_ns": received_ns,
+            "end_ns": received_ns,
+            "frames": 0,
+            "bytes": 0,
+        }
+        self.handle = gzip.open(os.path.join(self.directory, name), "ab")
+        self._update_index()
+
+    def _update_index(self):
+        index = read_index(self.directory, self.stream)
+        entry = {key: value for key, value in self.segment.items() if key != "bytes"}
+
+        if index and index[-1]["file"] == entry["file"]:
+            index[-1] = entry
+        else:
+            index.append(entry)
+
+        # Drop the oldest segments beyond the retention limit
+        for old in index[:max(0, len(index) - self.max_segments)]:
+            path = os.path.join(self.directory, old["file"])
+            if os.path.exists(path):
+                os.remove(path)
+        index = index[-self.max_segments:]
+
+        write_index(self.directory, self.stream, index)
+
+    def _close_segment(self):
+        self.handle.close()
+        self._update_index()
+        self.segment = None
+
+    def _write(self, received_ns, message):
+        if self.segment is not None:
+            too_old = received_ns - self.segment["start_ns"] >= self.segment_seconds * 1_000_000_000
+            if too_old or self.segment["bytes"] >= self.segment_bytes:
+                self._close_segment()
+
+        if self.segment is None:
+            self._open_segment(received_ns)
+
+        # Encoded here so segment_bytes counts bytes, not characters of multi-byte payloads
+        line = f"{received_ns}\t{message}\n".encode()
+        self.handle.write(line)
+        self.segment["end_ns"] = received_ns
+        self.segment["frames"] += 1
+        self.segment["bytes"] += len(line)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"Recorder error: {e}")
+
+        if self.segment is not None:
+            self._close_segment()
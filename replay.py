@@ -0,0 +1,158 @@
+"""Replay recorded frames through a local websocket server.
+
+Serves segments written by recorder.FrameRecorder in the same combined-stream
+format as fstream.binance.com, so the consumers only need an endpoint
+override:
+
+    python replay.py recordings --speed 100
+    python top_movers.py --endpoint "ws://localhost:9000/stream?streams=!markPrice@arr"
+
+Every connection gets its own replay from the first selected frame, in
+recorded order, so runs are reproducible. --speed 0 sends frames as fast as
+the client reads them.
+"""
+import argparse
+import asyncio
+import glob
+import gzip
+import heapq
+import json
+import os
+import time
+from urllib.parse import urlparse, parse_qs
+import websockets
+from recorder import INDEX_SUFFIX
+
+DEFAULT_PORT = 9000
+STREAM_PREFIX = '{"stream":"'
+
+
+def read_indexes(directory, labels=None):
+    """Index entries of every recorded stream in the directory, by label."""
+    indexes = {}
+    for path in sorted(glob.glob(os.path.join(directory, f"*{INDEX_SUFFIX}"))):
+        label = os.path.basename(path)[:-len(INDEX_SUFFIX)]
+        if labels and label not in labels:
+            continue
+
+        with open(path, 'r') as file:
+            indexes[label] = json.load(file)
+    return indexes
+
+
+def read_segment(directory, entry, start_ns=None, end_ns=None):
+    try:
+        with gzip.open(os.path.join(directory, entry["file"]), "rt", encoding="utf-8") as file:
+            for line in file:
+                received, _, message = line.rstrip("\n").partition("\t")
+                received_ns = int(received)
+                if start_ns is not None and received_ns < start_ns:
+                    continue
+                if end_ns is not None and received_ns > end_ns:
+                    return
+                yield received_ns, message
+    except EOFError:
+        # Segment of a recorder that was killed, everything before the cut is still valid
+        return
+
+
+def iter_stream(directory, entries, start_ns=None, end_ns=None):
+    for entry in entries:
+        # A segment whose recorder died still has frames 0 and a stale end_ns, only trust closed ones
+        if end_ns is not None and entry["start_ns"] > end_ns:
+            break
+        if start_ns is not None and entry["end_ns"] < start_ns and entry["frames"]:
+            continue
+        yield from read_segment(directory, entry, start_ns, end_ns)
+
+
+def iter_frames(directory, labels=None, start_ns=None, end_ns=None):
+    """Yield (received_ns, message) of all selected streams merged in receive order."""
+    indexes = read_indexes(directory, labels)
+    streams = [iter_stream(directory, indexes[label], start_ns, end_ns) for label in sorted(indexes)]
+    # Ties keep the label order, so the merge is deterministic
+    return heapq.merge(*streams, key=lambda frame: frame[0])
+
+
+def stream_name(message):
+    # Frames start with {"stream":"<name>", avoid decoding them just to route
+    if message.startswith(STREAM_PREFIX):
+        end = message.find('"', len(STREAM_PREFIX))
+        return message[len(STREAM_PREFIX):end]
+    return json.loads(message).get("stream")
+
+
+class ReplayServer:
+    def __init__(self, directory, speed=1.0, labels=None, start_ns=None, end_ns=None):
+        self.directory = directory
+        self.speed = speed
+        self.labels = labels
+        self.start_ns = start_ns
+        self.end_ns = end_ns
+
+    async def _answer_subscriptions(self, ws, requested):
+        # Reply to SUBSCRIBE like Binance does and start routing the new streams
+        async for message in ws:
+            request = json.loads(message)
+            if request.get("method") == "SUBSCRIBE":
+                requested.update(request.get("params", []))
+            await ws.send(json.dumps({"result": None, "id": request.get("id")}))
+
+    async def handler(self, ws):
+        request = getattr(ws, "request", None)
+        path = request.path if request is not None else ws.path
+        query = parse_qs(urlparse(path).query)
+        requested = set(stream for value in query.get("streams", []) for stream in value.split("/"))
+
+        subscriptions = asyncio.ensure_future(self._answer_subscriptions(ws, requested))
+
+        sent = 0
+        started = time.monotonic()
+        first_ns = None
+        try:
+            for received_ns, message in iter_frames(self.directory, self.labels, self.start_ns, self.end_ns):
+                if requested and stream_name(message) not in requested:
+                    continue
+
+                if first_ns is None:
+                    first_ns = received_ns
+
+                if self.speed > 0:
+                    delay = started + (received_ns - first_ns) / 1e9 / self.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+                await ws.send(message)
+                sent += 1
+
+            elapsed = time.monotonic() - started
+            print(f"Replay finished: {sent} frames in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):,.0f} frames/sec)")
+
+            # Stay connected so consumers don't reconnect and replay everything twice
+            await ws.wait_closed()
+        finally:
+            subscriptions.cancel()
+
+    async def serve(self, host, port):
+        async with websockets.serve(self.handler, host, port, max_size=None):
+            print(f"Replaying {self.directory} on ws://{host}:{port}/stream")
+            await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", help="directory with recorded segments")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier, 0 for as fast as possible")
+    parser.add_argument("--streams", nargs="*", help="recorded stream labels to replay, e.g. markPrice forceOrder")
+    parser.add_argument("--start", type=int, help="first receive time to replay, ns since epoch")
+    parser.add_argument("--end", type=int, help="last receive time to replay, ns since epoch")
+    args = parser.parse_args()
+
+    server = ReplayServer(args.directory, args.speed, args.streams, args.start, args.end)
+
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Replay stopped")
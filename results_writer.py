@@ -0,0 +1,96 @@
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+CHUNK_SIZE = 256  # Rows buffered before a flush, at most this many are lost on a crash
+
+TRADE_COLUMNS = [
+    ('Entry Reason', object),
+    ('Symbol', object),
+    ('Entry Time', np.float64),
+    ('Entry Price', np.float64),
+    ('Exit Time', np.float64),
+    ('Exit Price', np.float64),
+    ('Trailing Stop Loss', np.float64),
+    ('Profit/Loss', np.float64),
+]
+
+
+class ResultsWriter:
+    """Buffers result rows in typed, preallocated columns and appends them to disk in chunks.
+
+    append() writes one row into the buffer; once CHUNK_SIZE rows are
+    buffered they are appended to the CSV, and written as the next part
+    file of the Parquet directory when one is given and pyarrow is
+    installed, and the buffer is reused. Memory stays at one chunk however
+    long the session runs. A Parquet file is only readable once its footer
+    is written, so every chunk is a complete file of its own, renamed into
+    place; pd.read_parquet(directory) reads them all. The CSV and the
+    directory are started fresh, like the old write-at-exit file was.
+    """
+
+    def __init__(self, csv_path, columns=TRADE_COLUMNS, chunk_size=CHUNK_SIZE, parquet_path=None):
+        self.csv_path = csv_path
+        self.names = [name for name, _ in columns]
+        self.buffers = [np.empty(chunk_size, dtype=dtype) for _, dtype in columns]
+        self.size = 0
+        self.rows_written = 0
+
+        with open(csv_path, 'w') as file:
+            pd.DataFrame(columns=self.names).to_csv(file, index=False)
+
+        self.parquet_path = parquet_path
+        self.parts_written = 0
+        if parquet_path and pq is None:
+            print("pyarrow not installed, results are only written to CSV")
+            self.parquet_path = None
+        elif parquet_path:
+            os.makedirs(parquet_path, exist_ok=True)
+            for path in glob.glob(os.path.join(parquet_path, "part-*.parquet")) + glob.glob(os.path.join(parquet_path, ".part-*.tmp")):
+                os.remove(path)
+
+    def __len__(self):
+        return self.rows_written + self.size
+
+    def append(self, row):
+        for buffer, value in zip(self.buffers, row):
+            buffer[self.size] = value
+        self.size += 1
+
+        if self.size == len(self.buffers[0]):
+            self.flush()
+
+    def flush(self):
+        if self.size == 0:
+            return
+
+        chunk = pd.DataFrame({name: buffer[:self.size] for name, buffer in zip(self.names, self.buffers)})
+
+        with open(self.csv_path, 'a') as file:
+            chunk.to_csv(file, header=False, index=False)
+            file.flush()
+            os.fsync(file.fileno())
+
+        if self.parquet_path:
+            # Dot files are skipped by Parquet readers, a crash mid-write leaves nothing they would trip over
+            name = f"part-{self.parts_written:05d}.parquet"
+            temp_path = os.path.join(self.parquet_path, f".{name}.tmp")
+            pq.write_table(pa.Table.from_pandas(chunk, preserve_index=False), temp_path)
+            os.replace(temp_path, os.path.join(self.parquet_path, name))
+            self.parts_written += 1
+
+        self.rows_written += self.size
+        self.size = 0
+        for buffer in self.buffers:
+            if buffer.dtype == object:
+                buffer[:] = None
+
+    def close(self):
+        self.flush()
@@ -0,0 +1,242 @@
+"""Rolling mark-price windows in shared memory, written by one process and read by many.
+
+    python market_hub.py --shared-prices
+    python top_movers.py --shared
+    python mover_trading.py --shared
+
+SharedPriceStore is a PriceStore whose arrays live in one shared memory
+segment, next to the symbol names and a header. The ingestor updates it
+under a seqlock: the sequence number is odd while a frame is being written
+and even once it is complete. SharedPriceView attaches to the segment with
+read-only arrays and reads straight from the shared pages, without decoding
+a frame or copying the matrix; read() retries a read that overlapped a
+write, snapshot() returns a consistent private PriceStore copy. follow()
+keeps a reader attached across restarts of the publisher.
+"""
+import asyncio
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from price_store import PriceStore
+from reconnect import backoff_delay
+
+SHARED_PRICES_NAME = "mark_prices"
+SHARED_CAPACITY = 2048  # Symbol rows; a shared segment can't grow, so it is sized for the whole market up front
+SYMBOL_BYTES = 32
+POLL_INTERVAL = 0.02  # Seconds between sequence checks of a waiting reader
+STALE_SECONDS = 10  # A publisher silent this long is gone; a restarted one writes to a new segment
+
+# Header slots
+SEQUENCE, SYMBOLS, WINDOW, CAPACITY = range(4)
+HEADER_SLOTS = 8
+
+# Name, dtype and shape: a row per symbol, a row with a column per window slot, or a single value
+ARRAYS = [
+    ("prices", np.float64, "window"),
+    ("head", np.int64, "row"),
+    ("counts", np.int64, "row"),
+    ("direction_sum", np.float64, "row"),
+    ("direction_weighted", np.float64, "row"),
+    ("rate_sum", np.float64, "row"),
+    ("rate_weighted", np.float64, "row"),
+    ("names", f"S{SYMBOL_BYTES}", "row"),
+    ("updated_at", np.float64, "single"),
+]
+PRICE_STORE_ARRAYS = ["prices", "head", "counts", "direction_sum", "direction_weighted", "rate_sum", "rate_weighted"]
+
+
+def _layout(capacity, window_size):
+    """(name, dtype, shape, offset) of every array after the header, 8 byte aligned, and the total size."""
+    shapes = {"window": (capacity, window_size), "row": (capacity,), "single": (1,)}
+    offset = HEADER_SLOTS * 8
+    layout = []
+    for name, dtype, kind in ARRAYS:
+        shape = shapes[kind]
+        layout.append((name, dtype, shape, offset))
+        offset += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // 8) * 8
+    return layout, offset
+
+
+def _map_arrays(buffer, capacity, window_size):
+    header = np.ndarray(HEADER_SLOTS, dtype=np.int64, buffer=buffer)
+    layout, _ = _layout(capacity, window_size)
+    return header, {name: np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset) for name, dtype, shape, offset in layout}
+
+
+class SharedPriceStore(PriceStore):
+    """PriceStore in a named shared memory segment, published under a seqlock.
+
+    Only one process may write. Call close() when done, it also removes the segment.
+    """
+
+    def __init__(self, window_size, name=SHARED_PRICES_NAME, capacity=SHARED_CAPACITY):
+        # The arrays are placed in shared memory instead of PriceStore's private ones
+        if window_size < 2:
+            raise ValueError("window_size must be at least 2")
+
+        self.window_size = window_size
+        self.symbols = []
+        self.index = {}
+        self.updates = 0
+
+        _, size = _layout(capacity, window_size)
+        self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.header, arrays = _map_arrays(self.memory.buf, capacity, window_size)
+        for array_name, array in arrays.items():
+            setattr(self, array_name, array)
+
+        self.header[WINDOW] = window_size
+        self.header[CAPACITY] = capacity
+
+    def _grow(self):
+        raise ValueError(f"Shared price matrix is full at {len(self.prices)} symbols, raise SHARED_CAPACITY")
+
+    def update(self, symbols, prices):
+        self.header[SEQUENCE] += 1
+        try:
+            super().update(symbols, prices)
+
+            published = int(self.header[SYMBOLS])
+            for row in range(published, len(self.symbols)):
+                self.names[row] = self.symbols[row].encode()
+            self.header[SYMBOLS] = len(self.symbols)
+            self.updated_at[0] = time.time()
+        finally:
+            self.header[SEQUENCE] += 1
+
+    def close(self):
+        # Views must be gone before the buffer can be released
+        self.header = None
+        for name, _, _ in ARRAYS:
+            setattr(self, name, None)
+        self.memory.close()
+        self.memory.unlink()
+
+
+class SharedPriceView(PriceStore):
+    """Read-only PriceStore attached to a SharedPriceStore of another process.
+
+    Every PriceStore read works on the shared arrays directly, so ranking
+    functions take a view like a store. Wrap reads in read() to get a result
+    that no concurrent update tore apart.
+    """
+
+    def __init__(self, name=SHARED_PRICES_NAME):
+        # The segment belongs to the publisher, this process must not remove it when it exits
+        if sys.version_info >= (3, 13):
+            self.memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Before Python 3.13 attaching always registers the segment for removal
+            self.memory = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+
+        header = np.ndarray(HEADER_SLOTS, dtype=np.int64, buffer=self.memory.buf)
+        self.window_size = int(header[WINDOW])
+        self.header, arrays = _map_arrays(self.memory.buf, int(header[CAPACITY]), self.window_size)
+        for array_name, array in arrays.items():
+            array.flags.writeable = False
+            setattr(self, array_name, array)
+
+        self.symbols = []
+        self.index = {}
+        self.name = name
+        self.attached_at = time.time()
+
+    def update(self, symbols, prices):
+        raise TypeError("SharedPriceView is read-only, update the SharedPriceStore instead")
+
+    def resync(self):
+        pass
+
+    def sequence(self):
+        return int(self.header[SEQUENCE])
+
+    def age(self):
+        """Seconds since the publisher last wrote a frame, or since attaching if it wrote none since."""
+        return time.time() - max(float(self.updated_at[0]), self.attached_at)
+
+    def _sync_symbols(self):
+        # Symbols are only ever appended, so new names are picked up from where we left off
+        for row in range(len(self.symbols), int(self.header[SYMBOLS])):
+            symbol = self.names[row].decode()
+            self.symbols.append(symbol)
+            self.index[symbol] = row
+
+    def read(self, function, *args):
+        """Return function(self, *args), retried until it ran without an update in between.
+
+        function must return values that don't reference the shared arrays, e.g.
+        rank_movers or a copy, or a later update changes them underneath.
+        """
+        while True:
+            sequence = int(self.header[SEQUENCE])
+            if sequence & 1:
+                time.sleep(0)
+                continue
+
+            self._sync_symbols()
+            result = function(self, *args)
+            if int(self.header[SEQUENCE]) == sequence:
+                return result
+
+    def snapshot(self):
+        """A consistent private PriceStore copy of the used rows."""
+        return self.read(_copy_store)
+
+    async def frames(self, poll_interval=POLL_INTERVAL, stale_after=STALE_SECONDS):
+        """Yield each new sequence number, skipping updates that came in while the caller was busy.
+
+        Raises TimeoutError once the publisher wrote nothing for stale_after seconds.
+        """
+        seen = 0  # Nothing written yet
+        while True:
+            sequence = int(self.header[SEQUENCE])
+            if sequence != seen and not sequence & 1:
+                seen = sequence
+                yield sequence
+            elif self.age() > stale_after:
+                raise TimeoutError(f"No update of shared mark prices {self.name} in {stale_after}s")
+            else:
+                await asyncio.sleep(poll_interval)
+
+    def close(self):
+        self.header = None
+        for name, _, _ in ARRAYS:
+            setattr(self, name, None)
+        self.memory.close()
+
+
+async def follow(name=SHARED_PRICES_NAME, stale_after=STALE_SECONDS):
+    """Yield a SharedPriceView on every new frame, reattaching when the publisher is gone or restarted."""
+    attempt = 0
+    while True:
+        try:
+            view = SharedPriceView(name)
+        except FileNotFoundError:
+            print(f"Shared mark prices {name} not published")
+        else:
+            print(f"Attached to shared mark prices {name}")
+            try:
+                async for _ in view.frames(stale_after=stale_after):
+                    attempt = 0
+                    yield view
+            except TimeoutError as e:
+                print(e)
+            finally:
+                view.close()
+
+        delay = backoff_delay(attempt)
+        attempt += 1
+        print(f"Attaching to shared mark prices {name} again in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+
+def _copy_store(view):
+    size = len(view.symbols)
+    store = PriceStore(view.window_size, capacity=max(size, 1))
+    store.symbols = list(view.symbols)
+    store.index = dict(view.index)
+    for name in PRICE_STORE_ARRAYS:
+        getattr(store, name)[:size] = getattr(view, name)[:size]
+    return store
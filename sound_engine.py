@@ -0,0 +1,138 @@
+import itertools
+import os
+import queue
+import threading
+import time
+
+try:
+    import simpleaudio as sa
+except ImportError:
+    sa = None
+
+SOUND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sounds")  # Next to the code, not the working directory
+DEFAULT_PRIORITY = 9
+DEFAULT_COOLDOWN = 2
+
+
+class SimpleAudioBackend:
+    def load(self, path):
+        return sa.WaveObject.from_wave_file(path)
+
+    def play(self, name, sound):
+        return sound.play()
+
+
+class NullBackend:
+    """Loads and plays nothing, for headless machines."""
+
+    def load(self, path):
+        return path
+
+    def play(self, name, sound):
+        return None
+
+
+class RecordingBackend:
+    """Records (time, name) for every sound played instead of making noise."""
+
+    def __init__(self):
+        self.played = []
+
+    def load(self, path):
+        return path
+
+    def play(self, name, sound):
+        self.played.append((time.time(), name))
+        return None
+
+
+def default_backend():
+    if sa is None:
+        print("simpleaudio not installed, alerts will be silent")
+        return NullBackend()
+    return SimpleAudioBackend()
+
+
+class SoundEngine:
+    """Plays pre-decoded alert sounds from a background thread.
+
+    Every .wav in sound_dir is decoded once up front and played by its file
+    name. play() only queues the request, so the event loop never touches
+    the disk or the audio device.
+    Lower priority numbers are more important: a more important sound stops
+    a less important one that is still playing, while a less important one
+    is dropped if it arrives during a more important sound. Each priority
+    has its own cooldown.
+    """
+
+    def __init__(self, cooldowns=None, backend=None, sound_dir=SOUND_DIR):
+        self.cooldowns = cooldowns or {}
+        self.backend = backend or default_backend()
+
+        # Keyed by file name, so "sounds/wick.wav" finds its sound wherever the tool was started
+        self.sounds = {}
+        try:
+            file_names = sorted(os.listdir(sound_dir))
+        except FileNotFoundError:
+            print(f"Sound error: {sound_dir} not found, alerts will be silent")
+            file_names = []
+
+        for file_name in file_names:
+            if file_name.endswith(".wav"):
+                try:
+                    self.sounds[file_name] = self.backend.load(os.path.join(sound_dir, file_name))
+                except Exception as e:
+                    print(f"Sound error: {e}")
+
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()  # Keeps equal priorities first in, first out
+        self.last_played = {}
+        self.current = None
+        self.current_priority = None
+
+        self.worker = threading.Thread(target=self._run, name="sound-engine", daemon=True)
+        self.worker.start()
+
+    def play(self, sound_file, priority=DEFAULT_PRIORITY):
+        self.queue.put((priority, next(self.order), sound_file))
+
+    def wait(self, timeout=5):
+        """Block until queued sounds have been handled and the current one finished, e.g. before exiting."""
+        deadline = time.time() + timeout
+        while (self.queue.unfinished_tasks or self._is_playing()) and time.time() < deadline:
+            time.sleep(0.05)
+
+    def _is_playing(self):
+        return self.current is not None and self.current.is_playing()
+
+    def _run(self):
+        while True:
+            priority, _, sound_file = self.queue.get()
+            try:
+                self._handle(priority, sound_file)
+            except Exception as e:
+                print(f"Sound error: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _handle(self, priority, sound_file):
+        current_time = time.time()
+
+        # cooldown
+        cooldown = self.cooldowns.get(priority, DEFAULT_COOLDOWN)
+        if current_time - self.last_played.get(priority, 0) <= cooldown:
+            return
+
+        if self._is_playing():
+            if self.current_priority <= priority:
+                return
+            self.current.stop()
+
+        sound = self.sounds.get(os.path.basename(sound_file))
+        if sound is None:
+            print(f"Sound error: {sound_file} not loaded")
+            return
+
+        self.last_played[priority] = current_time
+        self.current = self.backend.play(sound_file, sound)
+        self.current_priority = priority
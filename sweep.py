@@ -0,0 +1,221 @@
+"""Sweep the mover_trading.py strategy over recorded markPrice data on every core.
+
+The recording is loaded once into a (ticks, symbols) price matrix, one row
+per frame, and the weighted direction of every symbol's window is computed
+for every tick up front. Both matrices go to shared memory, and each worker
+process takes one (lags, universe size) cell of the grid: it picks the
+entries the live rules would take at every tick and backtests them against
+every trailing and constant stop size with backtest.py.
+
+    python sweep.py recordings --top 3 5 10 --lags 19,39,59 9,19,29 --trailing 0.5 0.8 1.5
+
+The live rules are the defaults: the window of 60 prices, lags 19,39,59
+(prices[-20], prices[-40] and prices[0] of the window), the top 5 up and
+down movers and a 0.8% trailing stop.
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import backtest
+from trade import profit_loss
+
+WINDOW = 60
+LAGS = [(19, 39, 59)]
+TOP_COUNTS = [5]
+TRAILING_PERCENTAGES = [0.8]
+ADDED_PERCENTAGES = []
+DIRECTION_BLOCK = 4096  # Rows per running-sum block, keeps the sums small so float error stays negligible
+
+SUMMARY_COLUMNS = ['Lags', 'Top', 'Stop Type', 'Stop', 'Trades', 'Closed', 'Win Rate', 'Mean P/L', 'Total P/L']
+
+# Worker process state, set by _attach
+shared = {}
+
+
+def direction_matrix(prices, window):
+    """PriceStore.directions() of every tick's window of `window` prices, NaN until the window is full."""
+    ticks = len(prices)
+    changes = np.zeros_like(prices)
+    with np.errstate(invalid="ignore"):
+        changes[1:] = (prices[1:] - prices[:-1]) / prices[:-1]
+    changes = np.nan_to_num(changes, nan=0.0)
+
+    n = window - 1  # Changes in a full window, weighted 1 (oldest) to n (newest)
+    total = n * (n + 1) / 2
+    directions = np.full_like(prices, np.nan)
+
+    for start in range(n, ticks, DIRECTION_BLOCK):
+        stop = min(start + DIRECTION_BLOCK, ticks)
+        segment = changes[start - n + 1:stop]
+        local = np.arange(len(segment))[:, None]
+
+        plain = np.zeros((len(segment) + 1, prices.shape[1]))
+        weighted = np.zeros_like(plain)
+        np.cumsum(segment, axis=0, out=plain[1:])
+        np.cumsum(local * segment, axis=0, out=weighted[1:])
+
+        # Window ending at local row e spans rows e-n+1..e, where row s weighs s-(e-n)
+        ends = np.arange(n - 1, len(segment))
+        plain_sum = plain[ends + 1] - plain[ends - n + 1]
+        weighted_sum = weighted[ends + 1] - weighted[ends - n + 1]
+        directions[start:stop] = (weighted_sum - (ends - n)[:, None] * plain_sum) / total
+
+    # Symbols listed after the recording started have no full window yet
+    listed = np.zeros(prices.shape, dtype=bool)
+    listed[n:] = ~np.isnan(prices[:-n])
+    directions[~listed] = np.nan
+    return directions
+
+
+def find_entries(prices, directions, window, lags, k, symbol_ranks):
+    """(rows, columns, side_long, reasons) of every trade the live rules open, one tick at a time.
+
+    Longs come from the k highest directions whose price rose over the first
+    two lags, shorts from the k lowest whose price fell, like the top_up and
+    top_down loops of mover_trading.ws_connect. symbol_ranks is each column's
+    position in the sorted symbols; tied directions are decided by it like
+    ranking.select decides them by the symbol.
+    """
+    first, second, third = lags
+    rows = np.arange(window - 1, len(prices))
+    ranked = directions[rows]
+    k = min(k, prices.shape[1])
+
+    entries = []
+    for side_long in (True, False):
+        values = np.where(np.isnan(ranked), -np.inf if side_long else np.inf, ranked)
+        # Sorted on (value, symbol) like the live ranking, a partition would pick any of the tied columns
+        order = np.lexsort((np.broadcast_to(symbol_ranks, values.shape), values), axis=1)
+        columns = order[:, -k:] if side_long else order[:, :k]
+
+        tick = np.repeat(rows, k)
+        columns = columns.ravel()
+        valid = np.isfinite(values[tick - rows[0], columns])
+
+        price = prices[tick, columns]
+        at_first = prices[tick - first, columns]
+        at_second = prices[tick - second, columns]
+        at_third = prices[tick - third, columns]
+
+        if side_long:
+            two = (price > at_first) & (at_first > at_second)
+            three = two & (at_second > at_third)
+            names = ("2 Bullish bull", "3 Bullish bull")
+        else:
+            two = (price < at_first) & (at_first < at_second)
+            three = two & (at_second < at_third)
+            names = ("2 Bearish bear", "3 Bearish bear")
+
+        taken = valid & two
+        reasons = np.where(three[taken], names[1], names[0])
+        entries.append((tick[taken], columns[taken], np.full(taken.sum(), side_long), reasons))
+
+    rows, columns, side_long, reasons = (np.concatenate(parts) for parts in zip(*entries))
+    order = np.lexsort((columns, rows))
+    return rows[order], columns[order], side_long[order], reasons[order]
+
+
+def _summary(entry_prices, exit_rows, columns, side_long, parameters, stop_type, lags, k):
+    prices = shared["prices"]
+    closed = exit_rows >= 0
+    exit_prices = np.where(closed, prices[np.maximum(exit_rows, 0), columns], np.nan)
+    results = profit_loss(entry_prices, exit_prices, 100, side_long)
+
+    rows = []
+    for parameter, result, done in zip(parameters, results, closed):
+        count = int(done.sum())
+        rows.append([",".join(map(str, lags)), k, stop_type, parameter, len(result), count,
+                     float((result[done] > 0).sum() / count) if count else np.nan,
+                     float(np.nanmean(result)) if count else np.nan,
+                     float(np.nansum(result))])
+    return rows
+
+
+def run_cell(lags, k, trailing_percentages, added_percentages, window, horizon):
+    prices = shared["prices"]
+    rows, columns, side_long, reasons = find_entries(prices, shared["directions"], window, lags, k, shared["symbol_ranks"])
+    entry_prices = prices[rows, columns]
+
+    summary = []
+    if len(trailing_percentages):
+        exits = backtest.trailing_stop_exits(prices, rows, columns, side_long, trailing_percentages, horizon)
+        summary += _summary(entry_prices, exits, columns, side_long, trailing_percentages, "trailing", lags, k)
+
+    if len(added_percentages):
+        stops = backtest.constant_stop_prices(prices, rows, columns, side_long, added_percentages, window)
+        exits = backtest.constant_stop_exits(prices, rows, columns, side_long, stops, horizon)
+        summary += _summary(entry_prices, exits, columns, side_long, added_percentages, "constant", lags, k)
+
+    return summary
+
+
+def _share(array):
+    memory = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memory.buf)[:] = array
+    return memory
+
+
+def _attach(specs, symbol_ranks):
+    shared["symbol_ranks"] = symbol_ranks
+    # Keep the SharedMemory objects referenced for as long as the worker uses the arrays
+    for name, (memory_name, shape, dtype) in specs.items():
+        memory = shared_memory.SharedMemory(name=memory_name)
+        shared[name + "_memory"] = memory
+        shared[name] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+
+def run_sweep(prices, symbols, window=WINDOW, lags=LAGS, top_counts=TOP_COUNTS, trailing_percentages=TRAILING_PERCENTAGES,
+              added_percentages=ADDED_PERCENTAGES, horizon=None, workers=None):
+    """Ranked P/L table of every grid cell and stop size, best total first."""
+    for cell_lags in lags:
+        if max(cell_lags) > window - 1:
+            raise ValueError(f"Lags {cell_lags} reach beyond a window of {window} prices")
+
+    directions = direction_matrix(prices, window)
+    symbol_ranks = np.argsort(np.argsort(symbols, kind="stable"))
+    memories = {"prices": _share(prices), "directions": _share(directions)}
+    specs = {name: (memory.name, prices.shape, np.float64) for name, memory in memories.items()}
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(specs, symbol_ranks)) as pool:
+            futures = [pool.submit(run_cell, cell_lags, k, trailing_percentages, added_percentages, window, horizon)
+                       for cell_lags, k in itertools.product(lags, top_counts)]
+            rows = [row for future in futures for row in future.result()]
+    finally:
+        for memory in memories.values():
+            memory.close()
+            memory.unlink()
+
+    table = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    return table.sort_values('Total P/L', ascending=False, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", help="directory with a markPrice recording")
+    parser.add_argument("--window", type=int, default=WINDOW, help="prices per symbol window, MAX_LEN live")
+    parser.add_argument("--lags", nargs="+", default=[",".join(map(str, lags)) for lags in LAGS],
+                        help="three comma separated lags into the window, e.g. 19,39,59")
+    parser.add_argument("--top", nargs="+", type=int, default=TOP_COUNTS, help="universe sizes, TOP_COUNT live")
+    parser.add_argument("--trailing", nargs="*", type=float, default=TRAILING_PERCENTAGES, help="trailing stop percentages")
+    parser.add_argument("--added", nargs="*", type=float, default=ADDED_PERCENTAGES, help="constant stop added percentages")
+    parser.add_argument("--horizon", type=int, help="ticks a trade is followed for, all remaining by default")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default="sweep_results.csv")
+    args = parser.parse_args()
+
+    start = time.time()
+    times, symbols, prices = backtest.load_price_matrix(args.directory)
+    print(f"Loaded {prices.shape[0]} ticks of {prices.shape[1]} symbols in {time.time() - start:.1f}s")
+
+    lags = [tuple(int(lag) for lag in value.split(",")) for value in args.lags]
+    table = run_sweep(prices, symbols, args.window, lags, args.top, args.trailing, args.added, args.horizon, args.workers)
+    table.to_csv(args.out, index=False)
+
+    print(table.head(20).to_string(index=False))
+    print(f"{len(table)} results written to {args.out} in {time.time() - start:.1f}s")
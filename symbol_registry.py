@@ -0,0 +1,120 @@
+import csv
+import os
+import re
+import tempfile
+import time
+
+COMPACT_INTERVAL = 300  # Seconds between folding the journal into the CSV
+
+
+def read_symbol_list_csv(path):
+    if os.path.exists(path):
+        with open(path, 'r', newline='') as file:
+            reader = csv.reader(file)
+            symbol_list = [symbol for row in reader for symbol in row]
+        return symbol_list
+    else:
+        return []
+    
+
+def sanitize_symbol(symbol: str) -> str:
+    return re.sub(r'[^A-Za-z0-9+\-._/]', '', symbol)
+
+def write_symbol_list_csv(symbol_list, path):
+    # Clean the symbols before writing
+    clean_list = [sanitize_symbol(s) for s in symbol_list]
+
+    # Create a temporary file in the same directory
+    dir_name = os.path.dirname(path) or "."
+    fd, temp_path = tempfile.mkstemp(dir=dir_name, prefix="symbols_", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "w", newline='', encoding="utf-8") as tmp_file:
+            writer = csv.writer(tmp_file)
+            writer.writerow(clean_list)
+
+        # Only replace original after successful write
+        os.replace(temp_path, path)
+
+    except Exception as e:
+        # Cleanup temp file on error
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise e
+
+def read_journal(path):
+    if not os.path.exists(path):
+        return []
+
+    with open(path, 'r', encoding="utf-8") as file:
+        lines = file.read().split("\n")
+
+    # The last piece has no newline if the process died mid-write, drop it
+    return [sanitize_symbol(line) for line in lines[:-1] if sanitize_symbol(line)]
+
+
+class SymbolRegistry:
+    """Known symbols with O(1) membership and a crash-safe append-only journal.
+
+    Startup loads the CSV and replays the journal on top of it. Every new
+    symbol is appended to the journal and fsynced right away. compact()
+    writes the full list to the CSV with the atomic temp-file swap and only
+    then empties the journal, so a crash at any point loses nothing.
+    """
+
+    def __init__(self, csv_path, journal_path):
+        self.csv_path = csv_path
+        self.journal_path = journal_path
+
+        self.symbols = read_symbol_list_csv(csv_path)
+        self.known = set(self.symbols)
+        for symbol in read_journal(journal_path):
+            if symbol not in self.known:
+                self.symbols.append(symbol)
+                self.known.add(symbol)
+
+        self.journal = open(journal_path, 'a', encoding="utf-8")
+        self.dirty = False
+        self.last_compact = time.time()
+
+        # Fold the replayed journal in right away, which also drops a torn last line
+        if self.journal.tell():
+            self.compact()
+
+    def __contains__(self, symbol):
+        return symbol in self.known
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def add(self, symbol):
+        """Register a symbol, returning True if it was new."""
+        if symbol in self.known:
+            return False
+
+        self.symbols.append(symbol)
+        self.known.add(symbol)
+
+        self.journal.write(sanitize_symbol(symbol) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.dirty = True
+        return True
+
+    def compact(self):
+        write_symbol_list_csv(self.symbols, self.csv_path)
+
+        # Everything in the journal is in the CSV now
+        self.journal.truncate(0)
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+        self.dirty = False
+        self.last_compact = time.time()
+
+    def maybe_compact(self):
+        if self.dirty and time.time() - self.last_compact >= COMPACT_INTERVAL:
+            self.compact()
+
+    def close(self):
+        self.compact()
+        self.journal.close()
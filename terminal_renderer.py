@@ -0,0 +1,75 @@
+import asyncio
+import sys
+
+FRAME_RATE = 10  # Redraws per second at most
+
+
+class TerminalRenderer:
+    """Draws the latest snapshot of a dashboard at a capped frame rate.
+
+    Producers call show(snapshot) as often as they like; only the newest
+    snapshot is kept. run() wakes FRAME_RATE times a second and, when there
+    is a new snapshot, turns it into lines with layout(snapshot), moves the
+    cursor to each line that changed and rewrites only that one. The write
+    happens on a worker thread, so a slow terminal (e.g. over SSH) only
+    lowers the frame rate and never blocks the event loop.
+    """
+
+    def __init__(self, term, layout, frame_rate=FRAME_RATE, stream=None):
+        self.term = term
+        self.layout = layout
+        self.interval = 1 / frame_rate
+        self.stream = stream or sys.stdout
+
+        self.latest = None
+        self.drawn = []
+        self.full_redraw = True
+        self.frames = 0
+
+    def show(self, snapshot):
+        self.latest = snapshot
+
+    def invalidate(self):
+        """Repaint the whole screen on the next frame, e.g. after other output scribbled over it."""
+        self.full_redraw = True
+
+    def _diff(self, lines):
+        term = self.term
+        parts = []
+        if self.full_redraw:
+            parts.append(term.home + term.clear)
+            self.drawn = []
+            self.full_redraw = False
+
+        for row, line in enumerate(lines):
+            if row >= len(self.drawn) or self.drawn[row] != line:
+                parts.append(term.move_yx(row, 0) + line + term.clear_eol)
+
+        # The dashboard got shorter, blank the leftover lines
+        for row in range(len(lines), len(self.drawn)):
+            parts.append(term.move_yx(row, 0) + term.clear_eol)
+
+        self.drawn = list(lines)
+        return "".join(parts)
+
+    def _write(self, output):
+        self.stream.write(output)
+        self.stream.flush()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        shown = None
+
+        with self.term.hidden_cursor():
+            while True:
+                await asyncio.sleep(self.interval)
+
+                snapshot = self.latest
+                if snapshot is None or (snapshot is shown and not self.full_redraw):
+                    continue
+
+                output = self._diff(self.layout(snapshot))
+                shown = snapshot
+                if output:
+                    await loop.run_in_executor(None, self._write, output)
+                    self.frames += 1
@@ -0,0 +1,82 @@
+"""Vectorized stop exits against the trade.py classes stepped tick by tick.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from backtest import constant_stop_exits, constant_stop_prices, trailing_stop_exits
+from trade import ConstantStopLossTrade, TrailingStopLossTrade
+
+TICKS = 400
+SYMBOLS = 12
+ENTRIES = 150
+
+
+def price_matrix(seed):
+    # A coarse random walk so prices repeat and hit the extremes and stops exactly, with NaN gaps
+    rng = np.random.default_rng(seed)
+    steps = rng.choice([-0.02, -0.01, 0.0, 0.01, 0.02], size=(TICKS, SYMBOLS))
+    prices = np.round(10 + np.cumsum(steps, axis=0), 2)
+    prices[rng.random((TICKS, SYMBOLS)) < 0.15] = np.nan
+
+    rows, columns = np.nonzero(~np.isnan(prices[:-1]))
+    chosen = rng.choice(len(rows), ENTRIES, replace=False)
+    side_long = rng.random(ENTRIES) < 0.5
+    return prices, rows[chosen], columns[chosen], side_long
+
+
+def stepped_exits(prices, entry_rows, columns, trades):
+    # A NaN tick re-checks the last known price, as mover_trading does when a symbol is missing from a frame
+    exits = []
+    for row, column, trade in zip(entry_rows, columns, trades):
+        exit_row = -1
+        current = prices[row, column]
+        for tick in range(row + 1, len(prices)):
+            if not np.isnan(prices[tick, column]):
+                current = prices[tick, column]
+            if trade.check(current, tick):
+                exit_row = tick
+                break
+        exits.append(exit_row)
+    return exits
+
+
+def test_trailing_stop_exits_match_the_trade_class():
+    prices, entry_rows, columns, side_long = price_matrix(1)
+    percentages = [0.05, 0.1, 0.2, 0.5]
+    exits = trailing_stop_exits(prices, entry_rows, columns, side_long, percentages)
+
+    for parameter, percentage in enumerate(percentages):
+        trades = [TrailingStopLossTrade("S", prices[row, column], 100, row, long, "test", percentage)
+                  for row, column, long in zip(entry_rows, columns, side_long)]
+        np.testing.assert_array_equal(exits[parameter], stepped_exits(prices, entry_rows, columns, trades))
+
+    assert (exits >= 0).any() and (exits == -1).any()
+
+
+def test_constant_stop_exits_match_the_trade_class():
+    prices, entry_rows, columns, side_long = price_matrix(2)
+    added_percentages = [0.0, 0.1, 0.3]
+    stop_prices = constant_stop_prices(prices, entry_rows, columns, side_long, added_percentages, lookback=20)
+    exits = constant_stop_exits(prices, entry_rows, columns, side_long, stop_prices)
+
+    for parameter, added in enumerate(added_percentages):
+        trades = [ConstantStopLossTrade("S", prices[row, column], 100, row, long, "test", stop, added)
+                  for row, column, long, stop in zip(entry_rows, columns, side_long, stop_prices[parameter])]
+        np.testing.assert_array_equal(exits[parameter], stepped_exits(prices, entry_rows, columns, trades))
+
+    assert (exits >= 0).any() and (exits == -1).any()
+
+
+def test_short_horizon_checks_only_that_many_ticks():
+    prices, entry_rows, columns, side_long = price_matrix(3)
+    full = trailing_stop_exits(prices, entry_rows, columns, side_long, [0.1])
+    limited = trailing_stop_exits(prices, entry_rows, columns, side_long, [0.1], horizon=5)
+
+    within = (full >= 0) & (full - entry_rows <= 5)
+    np.testing.assert_array_equal(limited[within], full[within])
+    assert (limited[~within] == -1).all()
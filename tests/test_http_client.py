@@ -0,0 +1,128 @@
+"""BinanceClient against a local stub server: connection reuse, bounded concurrency and weight pacing.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from http_client import BinanceClient
+
+
+class StubBinance:
+    """Answers every GET with {}, counting connections and in-flight requests.
+
+    used_weight, when set, is sent back as X-MBX-USED-WEIGHT-1M, and
+    retry_after answers the next request with a 429.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.connections = set()
+        self.request_times = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.used_weight = None
+        self.retry_after = None
+
+    async def handle(self, request):
+        self.connections.add(id(request.transport))
+        self.request_times.append(time.time())
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        if self.retry_after is not None:
+            headers = {"Retry-After": str(self.retry_after)}
+            self.retry_after = None
+            return web.json_response({"code": -1003}, status=429, headers=headers)
+
+        headers = {"X-MBX-USED-WEIGHT-1M": str(self.used_weight)} if self.used_weight is not None else {}
+        return web.json_response({}, headers=headers)
+
+
+async def run_stub(stub, test, **client_args):
+    app = web.Application()
+    app.router.add_get("/{path:.*}", stub.handle)
+    server = TestServer(app)
+    await server.start_server()
+    client = BinanceClient(str(server.make_url("")).rstrip("/"), **client_args)
+    try:
+        await test(client)
+    finally:
+        await client.close()
+        await server.close()
+
+
+def test_connections_are_reused():
+    stub = StubBinance(delay=0.01)
+
+    async def test(client):
+        for _ in range(3):
+            await asyncio.gather(*(client.get("/fapi/v1/klines") for _ in range(20)))
+
+    asyncio.run(run_stub(stub, test, max_connections=4, max_concurrent=4))
+    assert len(stub.request_times) == 60
+    assert len(stub.connections) <= 4
+
+
+def test_concurrency_is_bounded():
+    stub = StubBinance(delay=0.02)
+
+    async def test(client):
+        await asyncio.gather(*(client.get("/fapi/v1/klines") for _ in range(30)))
+
+    asyncio.run(run_stub(stub, test, max_connections=10, max_concurrent=3))
+    assert stub.max_in_flight == 3
+
+
+def test_pauses_until_next_window_near_the_weight_limit():
+    # The server reports 8 of 10 used, the headroom share, so the next request waits for the next window
+    stub = StubBinance()
+    stub.used_weight = 8
+
+    async def test(client):
+        await client.get("/fapi/v1/klines")
+        window_end = client.window_start + client.weight_window
+        stub.used_weight = None
+        await client.get("/fapi/v1/klines")
+        assert stub.request_times[1] >= window_end
+
+    asyncio.run(run_stub(stub, test, weight_limit=10, weight_window=1))
+
+
+def test_local_weight_estimate_paces_before_any_header():
+    stub = StubBinance()
+
+    async def test(client):
+        await asyncio.gather(*(client.get("/fapi/v1/klines", weight=2) for _ in range(6)))
+
+    asyncio.run(run_stub(stub, test, weight_limit=10, weight_window=1))
+    # 8 of 10 is allowed per window, so 4 requests of weight 2 fit and the rest go into the next window
+    windows = [int(t) for t in stub.request_times]
+    assert windows.count(windows[0]) <= 4
+    assert windows[-1] > windows[0]
+
+
+def test_retry_after_pauses_every_request():
+    stub = StubBinance()
+    stub.retry_after = 1
+
+    async def test(client):
+        with pytest.raises(aiohttp.ClientResponseError):
+            await client.get("/fapi/v1/klines")
+        limited_at = time.time()
+        await client.get("/fapi/v1/klines")
+        assert stub.request_times[1] - limited_at >= 0.9
+
+    asyncio.run(run_stub(stub, test))
@@ -0,0 +1,98 @@
+"""PriceStore against the per-symbol list functions it replaced in top_movers.py and mover_trading.py.
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from price_store import PriceStore
+
+WINDOW = 60
+
+
+def calculate_rate_of_change(prices):
+    if len(prices) < 2:
+        return 0
+
+    weighted_sum = 0
+    total_weight = 0
+    for i in range(1, len(prices)):
+        weight = i / sum(range(1, len(prices)))
+        price_change = abs(prices[i] - prices[i - 1]) / prices[i - 1]
+        weighted_sum += weight * price_change
+        total_weight += weight
+    return weighted_sum / total_weight if total_weight != 0 else 0
+
+
+def calculate_direction_of_change(prices):
+    if len(prices) < 2:
+        return 0
+
+    weighted_sum = 0
+    total_weight = 0
+    for i in range(1, len(prices)):
+        weight = i / sum(range(1, len(prices)))
+        price_change = (prices[i] - prices[i - 1]) / prices[i - 1]
+        weighted_sum += weight * price_change
+        total_weight += weight
+    return weighted_sum / total_weight if total_weight != 0 else 0
+
+
+def update_mark_price(prices_dict, symbol, price):
+    if symbol in prices_dict:
+        prices_dict[symbol].append(float(price))
+
+        if len(prices_dict[symbol]) > WINDOW:
+            prices_dict[symbol].pop(0)
+    else:
+        prices_dict[symbol] = [float(price)]
+
+
+def test_directions_and_rates_match_the_list_functions():
+    # Past the resync interval, with symbols joining late and missing from some frames
+    rng = np.random.default_rng(1)
+    symbols = [f"S{i}USDT" for i in range(20)]
+    last = rng.uniform(0.01, 50000, len(symbols))
+    store = PriceStore(WINDOW, capacity=4)
+    prices_dict = {}
+
+    for step in range(1500):
+        present = np.flatnonzero(rng.random(len(symbols)) < min(1.0, 0.2 + step / 100))
+        last[present] *= 1 + rng.normal(0, 0.002, len(present))
+
+        batch = [symbols[i] for i in present]
+        store.update(batch, last[present])
+        for i in present:
+            update_mark_price(prices_dict, symbols[i], last[i])
+
+        if step % 50 == 0 or step > 1490:
+            expected_directions = [calculate_direction_of_change(prices_dict[symbol]) for symbol in store.symbols]
+            expected_rates = [calculate_rate_of_change(prices_dict[symbol]) for symbol in store.symbols]
+            np.testing.assert_allclose(store.directions(), expected_directions, rtol=1e-9, atol=1e-15)
+            np.testing.assert_allclose(store.rates(), expected_rates, rtol=1e-9, atol=1e-15)
+
+            for symbol in store.symbols:
+                assert store.direction(symbol) == pytest.approx(calculate_direction_of_change(prices_dict[symbol]), rel=1e-9, abs=1e-15)
+                assert store.rate(symbol) == pytest.approx(calculate_rate_of_change(prices_dict[symbol]), rel=1e-9, abs=1e-15)
+                np.testing.assert_array_equal(store.window(symbol), prices_dict[symbol])
+
+
+def test_ranking_order_matches_the_list_functions():
+    rng = np.random.default_rng(2)
+    symbols = [f"S{i}USDT" for i in range(30)]
+    store = PriceStore(WINDOW)
+    prices_dict = {}
+
+    prices = rng.uniform(1, 100, len(symbols))
+    for _ in range(200):
+        prices *= 1 + rng.normal(0, 0.003, len(symbols))
+        store.update(symbols, prices)
+        for symbol, price in zip(symbols, prices):
+            update_mark_price(prices_dict, symbol, price)
+
+    expected = sorted((calculate_direction_of_change(prices_dict[symbol]), symbol) for symbol in symbols)
+    assert [store.symbols[row] for row in np.argsort(store.directions(), kind="stable")] == [symbol for _, symbol in expected]
@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 
 def percentage_difference(old_value, new_value):
     if old_value == 0:
@@ -8,10 +7,6 @@ def percentage_difference(old_value, new_value):
     percentage_diff = (difference / old_value)
     return percentage_diff * 100
 
-def append_row(row_data):
-    global data
-    data = np.vstack([data, row_data])
-
 class Trade:
     def __init__(self, symbol, price, position_amount, entry_time, side_long, entry_reason):
         self.symbol = symbol
@@ -49,6 +44,20 @@ class Trade:
         else:
             return 0
 
+def profit_loss(entry_prices, exit_prices, position_amounts, side_long):
+    """Trade.calculate_profit_loss over arrays, NaN where it returns None."""
+    entry_prices = np.asarray(entry_prices, dtype=np.float64)
+    position_amounts = np.asarray(position_amounts, dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentage = (exit_prices - entry_prices) / entry_prices * 100
+    percentage = np.where(entry_prices == 0, 0.0, percentage)
+
+    result = np.where(side_long, position_amounts * percentage / 100, position_amounts * percentage * -1 / 100)
+    result = np.where(position_amounts == 0, 0.0, result)
+    result = np.where(position_amounts < 0, np.nan, result)
+    return np.where(np.isnan(exit_prices), np.nan, result)
+
 class TrailingStopLossTrade(Trade):
     def __init__(self, symbol, price, position_amount, entry_time, side_long, entry_reason, trailing_stop_loss_percentage):
         super().__init__(symbol, price, position_amount, entry_time, side_long, entry_reason)
@@ -85,24 +94,27 @@ class ConstantStopLossTrade(Trade):
 
 # Example usage:
 if __name__ == "__main__":
+    # Imported here, the trade classes and profit_loss are used by the live trader without pandas
+    from results_writer import ResultsWriter
+
     trades = []
-    n_columns = 7
-    data = np.array([]).reshape(0, n_columns)
+    results = ResultsWriter('trade_example.csv')
 
     # Create a trade
-    trade1 = TrailingStopLossTrade(symbol='AAPL', price=100, position_amount=100, entry_time='2024-05-10 09:30:00', side_long=False, trailing_stop_loss_percentage=1)
+    trade1 = TrailingStopLossTrade(symbol='AAPL', price=100, position_amount=100, entry_time=1715333400, side_long=False, entry_reason='example', trailing_stop_loss_percentage=1)
     trades.append(trade1)
 
     # Simulate price movement and check trade exit conditions
     current_price = 110
-    current_time = '2024-05-10 10:30:00'
-    for trade in trades:
+    current_time = 1715337000
+    for trade in list(trades):
         if trade.check(current_price, current_time):
             profit_loss = trade.calculate_profit_loss()
-            data = np.array([]).reshape(0, n_columns)
-            print([trade.symbol, trade.entry_time, trade.entry_price, trade.exit_time, trade.exit_price, trade.trailing_stop_loss_percentage, profit_loss])
-            append_row(np.array([trade.symbol, trade.entry_time, trade.entry_price, trade.exit_time, trade.exit_price, trade.trailing_stop_loss_percentage, profit_loss]))
+            row = [trade.entry_reason, trade.symbol, trade.entry_time, trade.entry_price, trade.exit_time, trade.exit_price, trade.trailing_stop_loss_percentage, profit_loss]
+            print(row)
+            results.append(row)
             trades.remove(trade)
 
-    df = pd.DataFrame(data, columns=['Symbol', 'Entry Time', 'Entry Price', 'Exit Time', 'Exit Price', 'Trailing Stop Loss', 'Profit/Loss'])
-    print(df)
+    results.close()
+    with open('trade_example.csv') as file:
+        print(file.read())
@@ -0,0 +1,135 @@
+from collections import namedtuple
+import numpy as np
+from trade import profit_loss
+
+INITIAL_CAPACITY = 256
+
+ClosedTrade = namedtuple("ClosedTrade", ["entry_reason", "symbol", "entry_time", "entry_price", "exit_time", "exit_price", "trailing_stop_loss_percentage", "profit_loss"])
+
+
+class TradeBook:
+    """Open trades as column arrays, checked against a whole price vector at once.
+
+    Trade i lives in row i of every column and rows [0, len) are all open.
+    check() moves every trailing extreme and finds every exit with the same
+    comparisons as trade.TrailingStopLossTrade and trade.ConstantStopLossTrade,
+    and closing a trade moves the last row into its place, so it is O(1).
+    Prices are looked up by the row the symbol has in the PriceStore; a
+    trade whose row is -1 has no price and is left as it is.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.size = 0
+
+        self.rows = np.zeros(capacity, dtype=np.int64)  # PriceStore row of the symbol
+        self.side_long = np.zeros(capacity, dtype=bool)
+        self.trailing = np.zeros(capacity, dtype=bool)  # Trailing stop, constant stop otherwise
+        self.entry_price = np.zeros(capacity)
+        self.extreme = np.zeros(capacity)  # Highest price for longs, lowest for shorts
+        self.stop_percentage = np.zeros(capacity)
+        self.stop_price = np.zeros(capacity)
+        self.position_amount = np.zeros(capacity)
+        self.entry_time = np.zeros(capacity)
+        self.symbol = np.empty(capacity, dtype=object)
+        self.entry_reason = np.empty(capacity, dtype=object)
+
+    def __len__(self):
+        return self.size
+
+    def _columns(self):
+        return ("rows", "side_long", "trailing", "entry_price", "extreme", "stop_percentage", "stop_price",
+                "position_amount", "entry_time", "symbol", "entry_reason")
+
+    def _grow(self):
+        capacity = len(self.rows) * 2
+        for name in self._columns():
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _open(self, symbol, row, price, position_amount, entry_time, side_long, entry_reason):
+        if self.size == len(self.rows):
+            self._grow()
+
+        i = self.size
+        self.rows[i] = row
+        self.side_long[i] = side_long
+        self.entry_price[i] = price
+        self.extreme[i] = price
+        self.position_amount[i] = position_amount
+        self.entry_time[i] = entry_time
+        self.symbol[i] = symbol
+        self.entry_reason[i] = entry_reason
+        self.size += 1
+        return i
+
+    def open_trailing(self, symbol, row, price, position_amount, entry_time, side_long, entry_reason, trailing_stop_loss_percentage):
+        """Same arguments as TrailingStopLossTrade, plus the symbol's PriceStore row."""
+        i = self._open(symbol, row, price, position_amount, entry_time, side_long, entry_reason)
+        self.trailing[i] = True
+        self.stop_percentage[i] = trailing_stop_loss_percentage
+        self.stop_price[i] = np.nan
+
+    def open_constant(self, symbol, row, price, position_amount, entry_time, side_long, entry_reason, stop_loss_price, added_percent):
+        """Same arguments as ConstantStopLossTrade, plus the symbol's PriceStore row."""
+        i = self._open(symbol, row, price, position_amount, entry_time, side_long, entry_reason)
+        self.trailing[i] = False
+        self.stop_percentage[i] = added_percent
+        self.stop_price[i] = stop_loss_price
+
+    def remap(self, index):
+        """Look every trade's row up again by symbol, for a store whose rows were assigned anew (symbol -> row)."""
+        for i in range(self.size):
+            self.rows[i] = index.get(self.symbol[i], -1)
+
+    def close(self, i):
+        last = self.size - 1
+        if i != last:
+            for name in self._columns():
+                column = getattr(self, name)
+                column[i] = column[last]
+
+        self.symbol[last] = None
+        self.entry_reason[last] = None
+        self.size = last
+
+    def check(self, prices, current_time):
+        """Check every open trade against prices (one per PriceStore row), close the exits and return them."""
+        n = self.size
+        if n == 0:
+            return []
+
+        rows = self.rows[:n]
+        # NaN compares false, so a trade without a price neither exits nor moves its extreme
+        current = np.where(rows >= 0, prices[np.maximum(rows, 0)], np.nan)
+        long = self.side_long[:n]
+        extreme = self.extreme[:n]
+        fraction = self.stop_percentage[:n] / 100
+        stop = self.stop_price[:n]
+
+        # Compare against the extreme before this price, then move it
+        long_trailing = (current <= extreme) & (current < extreme - extreme * fraction)
+        short_trailing = (current >= extreme) & (current > extreme + extreme * fraction)
+        trailing_hit = np.where(long, long_trailing, short_trailing)
+        constant_hit = np.where(long, current <= stop, current >= stop)
+        hit = np.where(self.trailing[:n], trailing_hit, constant_hit)
+
+        extreme[:] = np.where(long, np.fmax(extreme, current), np.fmin(extreme, current))
+
+        exits = np.flatnonzero(hit)
+        if not len(exits):
+            return []
+
+        results = profit_loss(self.entry_price[exits], current[exits], self.position_amount[exits], long[exits])
+        closed = [
+            ClosedTrade(self.entry_reason[i], self.symbol[i], self.entry_time[i], self.entry_price[i], current_time,
+                        float(current[i]), self.stop_percentage[i], float(result))
+            for i, result in zip(exits, results)
+        ]
+
+        # Highest rows first, so the row moved into a closed slot is never one still to close
+        for i in exits[::-1]:
+            self.close(i)
+
+        return closed
@@ -0,0 +1,125 @@
+import json
+import os
+import time
+import numpy as np
+
+RELOAD_CHECK_INTERVAL = 5  # Seconds between mtime checks of the trendline file
+
+
+class TrendlineIndex:
+    """Trendlines from trendline_data.json compiled into flat slope/intercept arrays.
+
+    Lines of a symbol occupy a contiguous slice of the arrays, so all of them
+    are evaluated in one step. The file is reloaded when its mtime changes;
+    lines that survive a reload keep their armed state, new lines start with
+    the active flag from the file.
+    """
+
+    def __init__(self, path, alert_percentage, activate_percentage):
+        self.path = path
+        self.alert_percentage = alert_percentage
+        self.activate_percentage = activate_percentage
+
+        self.mtime = None
+        self.last_check = 0
+
+        self.ranges = {}
+        self.keys = []
+        self.slope = np.zeros(0)
+        self.intercept = np.zeros(0)
+        self.active = np.zeros(0, dtype=bool)
+
+        self.reload_if_changed(force=True)
+
+    def __contains__(self, symbol):
+        self.reload_if_changed()
+        return symbol in self.ranges
+
+    def reload_if_changed(self, force=False):
+        now = time.time()
+        if not force and now - self.last_check < RELOAD_CHECK_INTERVAL:
+            return False
+        self.last_check = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+
+        if mtime == self.mtime:
+            return False
+
+        try:
+            with open(self.path, 'r') as file:
+                trendline_dict = json.load(file)
+        except (OSError, ValueError) as e:
+            # Caught mid-write by trendlines.py, try again on the next check
+            print(f"Trendline reload error: {e}")
+            return False
+
+        self.mtime = mtime
+        self.compile(trendline_dict)
+        return True
+
+    def compile(self, trendline_dict):
+        armed = dict(zip(self.keys, self.active.tolist()))
+
+        ranges = {}
+        keys = []
+        slope = []
+        intercept = []
+        active = []
+
+        for symbol, trendlines in trendline_dict.items():
+            start = len(keys)
+            for trendline in trendlines:
+                try:
+                    t1, p1, t2, p2, line_active = trendline
+                    t1, p1, t2, p2 = float(t1), float(p1), float(t2), float(p2)
+                except (TypeError, ValueError):
+                    print(f"Skipping malformed trendline of {symbol}: {trendline}")
+                    continue
+
+                if t1 == t2:
+                    # A line through two points at the same time has no slope, one bad line must not stop the reload
+                    print(f"Skipping trendline of {symbol} with both points at {t1}")
+                    continue
+
+                key = (symbol, t1, p1, t2, p2)
+                keys.append(key)
+
+                # p(t) = p1 + (p2 - p1) * (t - t1) / (t2 - t1) as a line in t
+                line_slope = (p2 - p1) / (t2 - t1)
+                slope.append(line_slope)
+                intercept.append(p1 - line_slope * t1)
+                active.append(armed.get(key, line_active))
+            ranges[symbol] = (start, len(keys))
+
+        self.ranges = ranges
+        self.keys = keys
+        self.slope = np.array(slope, dtype=np.float64)
+        self.intercept = np.array(intercept, dtype=np.float64)
+        self.active = np.array(active, dtype=bool)
+
+    def _evaluate(self, lines, close_prices, ts):
+        # Alert on armed lines price came close to, re-arm disarmed lines price moved away from
+        line_prices = self.slope[lines] * ts + self.intercept[lines]
+        percentage = np.abs((close_prices - line_prices) * 100 / close_prices)
+        active = self.active[lines]
+
+        alerts = active & (percentage <= self.alert_percentage)
+        rearm = ~active & (percentage >= self.activate_percentage)
+
+        self.active[lines[alerts]] = False
+        self.active[lines[rearm]] = True
+        return lines[alerts]
+
+    def check(self, symbol, close_price, ts):
+        """Positions, within the symbol's trendlines, of lines that just triggered an alert."""
+        self.reload_if_changed()
+        if symbol not in self.ranges:
+            return []
+
+        start, end = self.ranges[symbol]
+        lines = np.arange(start, end)
+        return (self._evaluate(lines, close_price, ts) - start).tolist()
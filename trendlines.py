@@ -1,4 +1,6 @@
 import json
+import os
+import tempfile
 from datetime import datetime
 
 FORMAT_STRING = "%d.%m.%Y %H:%M"
@@ -11,13 +13,30 @@ def read_trendline_txt():
 
 trendline_dict = read_trendline_txt()
 
+def write_trendline_file():
+    # Write to a temp file and swap it in, so a running wick_tracker never reloads a half-written file
+    dir_name = os.path.dirname(DATA_FILE) or "."
+    fd, temp_path = tempfile.mkstemp(dir=dir_name, prefix="trendlines_", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "w") as tmp_file:
+            json.dump(trendline_dict, tmp_file)
+
+        os.replace(temp_path, DATA_FILE)
+
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise e
+
 def main():
     try:
         while True:
-            add_trendline()
+            if add_trendline():
+                # Save right away so a running wick_tracker picks the line up
+                write_trendline_file()
     finally:
-        with open(DATA_FILE, 'w') as file:
-            json.dump(trendline_dict, file)
+        write_trendline_file()
         print("Script stopped.")
 
 def get_new_trendline_data():
@@ -55,5 +74,7 @@ def add_trendline():
     else:
         trendline_dict[symbol] = [data]
 
+    return True
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
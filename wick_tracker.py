@@ -1,23 +1,36 @@
+import argparse
 import time
 import json
 import aiohttp
 import asyncio
-import requests
-from requests.exceptions import HTTPError
 from datetime import datetime, timedelta
-import simpleaudio as sa
+from http_client import WEIGHT_LIMIT, BinanceClient
+from candle_builder import CANDLE_INTERVALS, CandleBuilder
+from decoders import decode_mark_prices
+from kline_store import KlineStore, stream_to_columns
+from market_hub import HUB_SOCKET, consume
+from reconnect import supervise
+from sound_engine import SoundEngine
+from trendline_index import TrendlineIndex
+import metrics
 
 FORMAT_STRING = "%d.%m.%Y %H:%M"
 TRENDLINE_DATA_FILE = "trendline_data.json"
 
-def read_trendline_file():
-    with open(TRENDLINE_DATA_FILE, 'r') as file:
-        trendline_dict = json.load(file)
-    return trendline_dict
-
-trendline_dict = read_trendline_file()
-
 BASE_URL = 'https://fapi.binance.com'
+client = BinanceClient(BASE_URL)
+# The kline store syncs on its own client with half the weight budget. It pauses once the IP's
+# used weight reaches that, so it never starves the alert backfill on client.
+store_client = BinanceClient(BASE_URL, max_concurrent=2, weight_limit=WEIGHT_LIMIT // 2)
+WS_URL = 'wss://fstream.binance.com/stream'
+MARK_PRICE_URL = 'wss://fstream.binance.com/stream?streams=!markPrice@arr'
+MARK_PRICE_STALE_SECONDS = 10  # Mark prices arrive every second
+KLINE_INTERVAL = '1m'
+STREAMS_PER_CONNECTION = 200  # Binance caps streams per websocket connection
+KLINE_STALE_SECONDS = 30  # Kline streams push several times a minute, silence this long means a dead connection
+KLINE_SYNC_SECONDS = 3600  # Between syncs of the local kline store, they fill holes live appends had to skip
+KLINE_WRITE_DELAY = 5  # Seconds closed klines wait before they are appended to the store, in one batch
+KLINE_HISTORY_DAYS = 1  # Downloaded into the store for symbols it doesn't have yet, kline_store.py sync fetches more
 RETRACE_THRESHOLD = 35  # Percentage threshold for retracement
 MIN_CANDLE_PERCENTAGE = 1
 LARGE_CANDLE_PERCENT = 3
@@ -28,79 +41,67 @@ LARGE_SOUND_FILE = "sounds/liq.wav"
 TRENDLINE_SOUND_FILE = "sounds/trendline.wav"
 WARNING_SOUND_FILE = "sounds/warn.wav"
 
+# Lower number wins, a more important alarm cuts off a less important one
+SOUND_PRIORITIES = {
+    WARNING_SOUND_FILE: 0,
+    TRENDLINE_SOUND_FILE: 1,
+    LARGE_SOUND_FILE: 2,
+    SOUND_FILE: 3,
+}
+
+# Seconds between two sounds of the same priority
+SOUND_COOLDOWNS = {0: 0, 1: 2, 2: 2, 3: 2}
+
+sound_engine = SoundEngine(SOUND_COOLDOWNS)
+
+latency = metrics.StreamLatency("kline")
+metrics.gauge("sound_queue_depth", "Sounds waiting for the sound engine", sound_engine.queue.qsize)
+
+trendline_index = TrendlineIndex(TRENDLINE_DATA_FILE, TRENDLINE_ALERT_PERCENTAGE, TRENDLINE_ACTIVATE_PERCENTAGE)
+
 EXCEPTIONS = []
 
 message_history = {}
 large_history = {}
 
-COOLDOWN_TIME = 2
-cooldown_start = time.time()
+kline_store = None  # KlineStore kept current from the streams when --kline-store is given
+closed_klines = []  # Closed stream klines waiting to be appended to kline_store
 
 def percentage_diff(high, low):
     return (high - low) * 100 / high
 
 def play_sound(sound_file):
-    global cooldown_start
-    current_time = time.time()
-
-    # cooldown
-    if current_time - cooldown_start <= COOLDOWN_TIME:
-        return
-
-    cooldown_start = current_time
-
-    try:
-        wave_obj = sa.WaveObject.from_wave_file(sound_file)
-        wave_obj.play()
-    except Exception as e:
-        print(f"Sound error: {e}")
-
+    # Queued for the sound engine's worker, never blocks the event loop
+    sound_engine.play(sound_file, SOUND_PRIORITIES[sound_file])
 
-def interpolate_price(t, t1, p1, t2, p2):
-    return p1 + (p2 - p1) * ((t - t1) / (t2 - t1))
 
 def check_trendlines(symbol, close_price):
-    if not symbol in trendline_dict.keys():
+    if symbol not in trendline_index:
         return False
     
     ts = time.time()
-    
-    trendlines = trendline_dict[symbol]
-    for i, trendline in enumerate(trendlines):
-        t1, p1, t2, p2, active = trendline
-
-        p = interpolate_price(ts, t1, p1, t2, p2)
-        percentage = abs(percentage_diff(close_price, p))
-        if active and percentage <= TRENDLINE_ALERT_PERCENTAGE:
-
-            dt = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
-            message = f'{dt} \033[35m{symbol}\033[0m\033[94m Close to trendline!\033[0m'
-            print(message)
-            print()
-            play_sound(TRENDLINE_SOUND_FILE)
 
-            trendline_dict[symbol][i][4] = False
+    # All of the symbol's lines are evaluated at once, armed state is kept in the index
+    for _ in trendline_index.check(symbol, close_price, ts):
+        dt = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+        message = f'{dt} \033[35m{symbol}\033[0m\033[94m Close to trendline!\033[0m'
+        print(message)
+        print()
+        latency.alerted()
+        play_sound(TRENDLINE_SOUND_FILE)
 
-        elif not active and percentage >= TRENDLINE_ACTIVATE_PERCENTAGE:
-            trendline_dict[symbol][i][4] = True
-
-def get_all_usdt_futures_pairs():
+async def get_all_usdt_futures_pairs():
     try:
-        response = requests.get(f'{BASE_URL}/fapi/v1/exchangeInfo')
-        response.raise_for_status()
-        exchange_info = response.json()
+        exchange_info = await client.get('/fapi/v1/exchangeInfo')
         return [symbol['symbol'] for symbol in exchange_info['symbols'] if symbol['quoteAsset'] == 'USDT' and 'PERPETUAL' in symbol['contractType']]
-    except HTTPError as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         print(f'Error getting exchange information: {e}')
         return None
 
 async def get_candlestick_data(symbol, interval='1m'):
     try:
         params = {'symbol': symbol, 'interval': interval, 'limit': 2}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f'{BASE_URL}/fapi/v1/klines', params=params) as response:
-                response.raise_for_status()
-                return await response.json()
+        return await client.get('/fapi/v1/klines', params=params)
     except Exception as e:
         print(f"Error for {symbol}: {e}")
         return None   # Safe value
@@ -131,8 +132,10 @@ def calculate_retracement(candlestick):
     return retracement, direction, candle_percent
 
 
-def check_candle(symbol, candle):
-    check_trendlines(symbol, float(candle[4]))
+def check_candle(symbol, candle, interval=KLINE_INTERVAL):
+    # Trendlines are checked once a minute, the longer candles' closes are the same prices again
+    if interval == KLINE_INTERVAL:
+        check_trendlines(symbol, float(candle[4]))
     retracement, direction, candle_percent = calculate_retracement(candle)
     if abs(candle_percent) > LARGE_CANDLE_PERCENT:
         ts = candle[0]
@@ -143,7 +146,7 @@ def check_candle(symbol, candle):
         dt = dt_base + timedelta(milliseconds=milliseconds)
         dt = dt.replace(microsecond=0)
 
-        notify_large(symbol, dt, candle_percent)
+        notify_large(symbol, dt, candle_percent, interval)
 
     if retracement >= RETRACE_THRESHOLD and candle_percent > MIN_CANDLE_PERCENTAGE:
         ts = candle[0]
@@ -154,11 +157,16 @@ def check_candle(symbol, candle):
         dt = dt_base + timedelta(milliseconds=milliseconds)
         dt = dt.replace(microsecond=0)
         
-        notify(symbol, dt, retracement, direction, candle_percent)
+        notify(symbol, dt, retracement, direction, candle_percent, interval)
+
+def interval_label(interval):
+    # 1m candles keep the original message, other timeframes are named
+    return "" if interval == KLINE_INTERVAL else f" {interval}"
 
-def notify_large(symbol, dt, candle_percent):
+def notify_large(symbol, dt, candle_percent, interval=KLINE_INTERVAL):
+    key = (symbol, interval)
     try:
-        if large_history[symbol][0] == dt:
+        if large_history[key][0] == dt:
             return 0
     except KeyError:
         pass
@@ -170,17 +178,19 @@ def notify_large(symbol, dt, candle_percent):
 
     # Your original message
         
-    message = f'{dt} \033[35m{symbol}\033[0m Large \033[94m{candle_percent:.2f}%\033[0m Candle'
+    message = f'{dt} \033[35m{symbol}\033[0m Large{interval_label(interval)} \033[94m{candle_percent:.2f}%\033[0m Candle'
     print(message)  # Replace with your notification code
     print()
+    latency.alerted()
     play_sound(LARGE_SOUND_FILE)
 
-    if symbol not in large_history.keys() or dt > large_history[symbol][0]:
-        large_history[symbol] = [dt, candle_percent]
+    if key not in large_history.keys() or dt > large_history[key][0]:
+        large_history[key] = [dt, candle_percent]
 
-def notify(symbol, dt, retracement, direction, candle_percent):
+def notify(symbol, dt, retracement, direction, candle_percent, interval=KLINE_INTERVAL):
+    key = (symbol, interval)
     try:
-        if message_history[symbol] == dt:
+        if message_history[key] == dt:
             return 0
     except KeyError:
         pass
@@ -202,40 +212,135 @@ def notify(symbol, dt, retracement, direction, candle_percent):
 
     # Your original message
         
-    message = f'{dt} \033[35m{symbol}\033[0m {color_code}{direction}\033[0m {retracement:.2f}% from {color_percent}{candle_percent:.2f}% \033[0m'
+    message = f'{dt} \033[35m{symbol}\033[0m{interval_label(interval)} {color_code}{direction}\033[0m {retracement:.2f}% from {color_percent}{candle_percent:.2f}% \033[0m'
     print(message)  # Replace with your notification code
     print()
+    latency.alerted()
     # play_sound(SOUND_FILE)
 
     
-    if symbol not in message_history.keys() or dt > message_history[symbol]:
-        message_history[symbol] = dt
+    if key not in message_history.keys() or dt > message_history[key]:
+        message_history[key] = dt
+
+def kline_to_candle(kline):
+    # Reshape a websocket kline payload into the REST candlestick layout check_candle expects
+    return [kline["t"], kline["o"], kline["h"], kline["l"], kline["c"], kline["v"]]
+
+def shard_symbols(symbols, size=STREAMS_PER_CONNECTION):
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+async def backfill(symbols):
+    tasks = [get_candlestick_data(symbol, KLINE_INTERVAL) for symbol in symbols]
+    candlesticks_list = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for symbol, candlesticks in zip(symbols, candlesticks_list):
+        if not candlesticks or isinstance(candlesticks, Exception) or len(candlesticks) < 2:
+            continue
+
+        for candle in candlesticks:
+            check_candle(symbol, candle)
+
+def queue_closed_kline(kline):
+    # Written to the store a few seconds after the minute's closes came in, not between their alerts
+    if not closed_klines:
+        asyncio.get_running_loop().call_later(KLINE_WRITE_DELAY, write_closed_klines)
+    closed_klines.append(kline)
+
+def write_closed_klines():
+    # The file appends run on a worker thread, the store's lock keeps them apart from a sync or compaction
+    batch = closed_klines[:]
+    closed_klines.clear()
+    asyncio.get_running_loop().run_in_executor(None, append_closed_klines, batch)
+
+def append_closed_klines(batch):
+    for kline in batch:
+        try:
+            kline_store.append_next(kline["s"], stream_to_columns(kline))
+        except Exception as e:
+            print(f"Kline store error for {kline['s']}: {e}")
+
+async def stream_klines(symbols, shard=0):
+    def on_message(message, received_at):
+        data = json.loads(message)
+
+        if "stream" in data and "@kline" in data["stream"]:
+            kline = data["data"]["k"]
+            latency.decoded(data["data"]["E"], received_at)
+            check_candle(kline["s"], kline_to_candle(kline))
+            latency.done()
+
+            if kline_store is not None and kline["x"]:
+                queue_closed_kline(kline)
+
+    async def on_connect():
+        # Catch up on candles missed before (re)connecting
+        await backfill(symbols)
+
+    streams = [f"{symbol.lower()}@kline_{KLINE_INTERVAL}" for symbol in symbols]
+    await supervise(WS_URL, on_message, subscribe=streams, on_connect=on_connect, stale_after=KLINE_STALE_SECONDS,
+                    name=f"klines shard {shard} ({len(symbols)} symbols from {symbols[0]})")
+
+async def stream_mark_price_candles(symbols, intervals=CANDLE_INTERVALS, hub=None):
+    tracked = set(symbols)
+    builder = CandleBuilder(intervals)
+
+    def handle_frame(frame, received_at):
+        latency.decoded(frame.event_time, received_at)
+        for symbol, interval, candle in builder.update(frame.symbols, frame.prices, frame.event_time):
+            if symbol in tracked:
+                check_candle(symbol, candle, interval)
+        latency.done()
+
+    def on_message(message, received_at):
+        frame = decode_mark_prices(message)
+        if frame is not None:
+            handle_frame(frame, received_at)
+
+    # Every tick can set a high or low, so frames are never conflated here.
+    # The stream has no history to backfill, a candle that missed ticks in a gap is dropped as partial
+    if hub:
+        await consume(["markPrice"], lambda label, frame: handle_frame(frame, time.time()), hub, conflate=())
+    else:
+        await supervise(MARK_PRICE_URL, on_message, stale_after=MARK_PRICE_STALE_SECONDS, name="mark price candles")
 
-async def track_all_pairs():
-    symbols = get_all_usdt_futures_pairs()
+async def keep_kline_store(symbols):
+    while True:
+        started = time.time()
+        added = await kline_store.sync_all(store_client, symbols, KLINE_HISTORY_DAYS)
+        print(f"Kline store synced, {added} new candles in {time.time() - started:.1f}s")
+        await asyncio.sleep(KLINE_SYNC_SECONDS)
 
-    EXCLUDE = {"BTCSTUSDT", "GAIBUSDT"}
+async def track_all_pairs(metrics_port=None, kline_dir=None, mark_prices=False, hub=None):
+    global kline_store, latency
 
-    symbols = [s for s in symbols if s not in EXCLUDE]
+    if metrics_port:
+        asyncio.ensure_future(metrics.serve(metrics_port))
 
+    try:
+        symbols = await get_all_usdt_futures_pairs()
 
-    if not symbols:
-        print("no symbols!")
-        return False
+        EXCLUDE = {"BTCSTUSDT", "GAIBUSDT"}
 
-    while True:
-        tasks = [get_candlestick_data(symbol) for symbol in symbols]
-        candlesticks_list = await asyncio.gather(*tasks, return_exceptions=True)
+        if not symbols:
+            print("no symbols!")
+            return False
 
-        for symbol, candlesticks in zip(symbols, candlesticks_list):
-            if not candlesticks or len(candlesticks) < 2:
-                continue
+        symbols = [s for s in symbols if s not in EXCLUDE]
 
-            if len(candlesticks) >= 2:
-                for candle in candlesticks:
-                    check_candle(symbol, candle)
+        if kline_dir:
+            kline_store = KlineStore(kline_dir, KLINE_INTERVAL)
+            asyncio.ensure_future(keep_kline_store(symbols))
 
-        await asyncio.sleep(15)  # Check every 5 seconds
+        if mark_prices or hub:
+            latency = metrics.StreamLatency("markPrice candles")
+            # Candles of every timeframe from the one mark-price connection, or the hub's, no kline streams or REST
+            await stream_mark_price_candles(symbols, hub=hub)
+        else:
+            # One websocket per shard, each within the per-connection stream limit
+            await asyncio.gather(*[stream_klines(shard, i) for i, shard in enumerate(shard_symbols(symbols))])
+    finally:
+        await client.close()
+        await store_client.close()
 
 def run_infinite():
     try:
@@ -246,10 +351,20 @@ def run_infinite():
     except Exception as e:
         print(e)
         play_sound(WARNING_SOUND_FILE)
+        sound_engine.wait()
         exit(1)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--metrics", type=int, metavar="PORT", help="serve Prometheus metrics on localhost:PORT")
+    parser.add_argument("--kline-store", metavar="DIR", help="keep a local kline history in DIR up to date, see kline_store.py")
+    parser.add_argument("--mark-prices", action="store_true",
+                        help=f"build {'/'.join(CANDLE_INTERVALS)} candles from !markPrice@arr instead of kline streams (mark price, not last trade, OHLC)")
+    parser.add_argument("--hub", nargs="?", const=HUB_SOCKET, metavar="SOCKET",
+                        help="build the --mark-prices candles from a running market_hub.py instead of a connection of its own")
+    args = parser.parse_args()
+
     try:
-        asyncio.run(track_all_pairs())
+        asyncio.run(track_all_pairs(args.metrics, args.kline_store, args.mark_prices, args.hub))
     except KeyboardInterrupt:
         print("Interrupted")
\ No newline at end of file